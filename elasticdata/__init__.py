@@ -1,25 +1,71 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
+import threading
 from django.conf import settings
 from elasticsearch import Elasticsearch
 
 from .type import Type, TimestampedType, ValidationError
 from .manager import EntityManager, RepositoryError, EntityNotFound
+from .compression import get_client_settings
+from .replicas import ReadPin, create_read_client
 
+_clients = {}
+_read_pins = {}
+_clients_lock = threading.Lock()
 
-def get_entity_manager(index=None, es_settings=None):
-    return EntityManager(index=get_index(index), es_settings=get_es_settings(es_settings))
+
+def get_entity_manager(index=None, es_settings=None, read_es_settings=None):
+    """ Returns manager configured by settings
+        :param read_es_settings: settings of read client or list of settings of replicas, defaults to
+            ELASTICSEARCH_READ_CONFIG setting, reads are pinned to primary for ELASTICSEARCH_PIN_READS seconds
+    """
+    return EntityManager(index=get_index(index), es_settings=get_es_settings(es_settings),
+                         read_es_settings=get_read_es_settings(read_es_settings), pin_reads=get_shared_read_pin())
 
 
 def get_client(es_settings=None):
     es_settings = get_es_settings(es_settings)
     if es_settings:
-        return Elasticsearch(**es_settings)
+        return Elasticsearch(**get_client_settings(es_settings))
     else:
         return Elasticsearch()
 
 
+def get_shared_client(es_settings=None):
+    """ Returns client shared by whole process for given settings, its connection pool is thread safe """
+    es_settings = get_es_settings(es_settings)
+    key = json.dumps(es_settings, sort_keys=True, default=repr)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = get_client(es_settings)
+        return _clients[key]
+
+
+def get_shared_read_client(read_es_settings=None):
+    """ Returns read client or ReplicaSet shared by whole process, None when reads aren't split """
+    read_es_settings = get_read_es_settings(read_es_settings)
+    if not read_es_settings:
+        return None
+    key = 'read:' + json.dumps(read_es_settings, sort_keys=True, default=repr)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = create_read_client(read_es_settings)
+        return _clients[key]
+
+
+def get_shared_read_pin():
+    """ Returns ReadPin shared by whole process, None when ELASTICSEARCH_PIN_READS isn't set """
+    duration = getattr(settings, 'ELASTICSEARCH_PIN_READS', 0)
+    if not duration:
+        return None
+    with _clients_lock:
+        if duration not in _read_pins:
+            _read_pins[duration] = ReadPin(duration)
+        return _read_pins[duration]
+
+
 def get_index(index=None):
     if not index:
         return getattr(settings, 'ELASTICSEARCH_INDEX', 'default')
@@ -29,4 +75,10 @@ def get_index(index=None):
 def get_es_settings(es_settings):
     if not es_settings:
         return getattr(settings, 'ELASTICSEARCH_CONFIG', None)
-    return es_settings
\ No newline at end of file
+    return es_settings
+
+
+def get_read_es_settings(read_es_settings):
+    if not read_es_settings:
+        return getattr(settings, 'ELASTICSEARCH_READ_CONFIG', None)
+    return read_es_settings
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import threading
+from elasticsearch import helpers, TransportError
+from elasticsearch.helpers import BulkIndexError
+
+from .metrics import null_metrics
+
+REJECTED = 429
+
+
+class AdaptiveBulkSender(object):
+    """ Sends bulk requests in chunks which size follows cluster feedback
+
+        Chunk limits are decreased when items are rejected or bulk takes longer than target time, and
+        increased when full chunks are processed in less than half of it. Rejected items are retried
+        with exponential backoff. Instance keeps state between requests, so it should be shared.
+        :param target_time: desired server side duration of one bulk request in seconds
+        :param max_retries: how many times rejected items are resent
+        :param metrics: Metrics instance receiving latency, took, rejections and chosen chunk sizes
+    """
+    def __init__(self, chunk_size=500, min_chunk_size=10, max_chunk_size=5000, chunk_bytes=5 * 1024 * 1024,
+                 min_chunk_bytes=64 * 1024, max_chunk_bytes=50 * 1024 * 1024, target_time=0.5, max_retries=3,
+                 backoff=0.1, metrics=None):
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.chunk_bytes = chunk_bytes
+        self.min_chunk_bytes = min_chunk_bytes
+        self.max_chunk_bytes = max_chunk_bytes
+        self.target_time = target_time
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = metrics or null_metrics
+        self._lock = threading.Lock()
+
+    def send(self, client, actions, raise_on_error=True, **kwargs):
+        """ Works like elasticsearch.helpers.streaming_bulk, yields (ok, item) for every action in order """
+        serializer = client.transport.serializer
+        chunk, size = [], 0
+        for action in actions:
+            action_line, data = helpers.expand_action(action)
+            lines = [serializer.dumps(action_line)]
+            if data is not None:
+                lines.append(serializer.dumps(data))
+            cur_size = sum(len(line) + 1 for line in lines)
+            if chunk and (len(chunk) >= self.chunk_size or size + cur_size > self.chunk_bytes):
+                for result in self._process_chunk(client, chunk, size, raise_on_error, kwargs):
+                    yield result
+                chunk, size = [], 0
+            chunk.append(lines)
+            size += cur_size
+        if chunk:
+            for result in self._process_chunk(client, chunk, size, raise_on_error, kwargs):
+                yield result
+
+    def _process_chunk(self, client, chunk, size, raise_on_error, kwargs):
+        results = self._send_chunk(client, chunk, size, kwargs)
+        errors = [item for ok, item in results if not ok]
+        for result in results:
+            yield result
+        if errors and raise_on_error:
+            raise BulkIndexError('{num} document(s) failed to index.'.format(num=len(errors)), errors)
+
+    def _send_chunk(self, client, chunk, size, kwargs):
+        results = [None] * len(chunk)
+        pending = list(range(len(chunk)))
+        attempt = 0
+        while pending:
+            body = '\n'.join(line for i in pending for line in chunk[i]) + '\n'
+            started = time.time()
+            try:
+                resp = client.bulk(body, **kwargs)
+            except TransportError as e:
+                if e.status_code != REJECTED or attempt >= self.max_retries:
+                    raise
+                self._adjust(time.time() - started, None, len(pending), size, len(pending))
+            else:
+                rejected = []
+                for i, item in zip(pending, resp['items']):
+                    op_type, info = list(item.items())[0]
+                    status = info.get('status', 500)
+                    if status == REJECTED and attempt < self.max_retries:
+                        rejected.append(i)
+                    else:
+                        results[i] = (200 <= status < 300, {op_type: info})
+                self._adjust(time.time() - started, resp.get('took'), len(pending), size, len(rejected))
+                pending = rejected
+            if pending:
+                time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+        return results
+
+    def _adjust(self, latency, took, count, size, rejected):
+        duration = took / 1000.0 if took is not None else latency
+        full = count >= self.chunk_size * 0.9 or size >= self.chunk_bytes * 0.9
+        if rejected:
+            factor = 0.5
+        elif duration > self.target_time:
+            factor = 0.75
+        elif duration < self.target_time / 2 and full:
+            factor = 1.25
+        else:
+            factor = 1.0
+        with self._lock:
+            self.chunk_size = min(max(int(self.chunk_size * factor), self.min_chunk_size), self.max_chunk_size)
+            self.chunk_bytes = min(max(int(self.chunk_bytes * factor), self.min_chunk_bytes),
+                                   self.max_chunk_bytes)
+        self.metrics.timing('elasticdata.bulk.latency', latency)
+        if took is not None:
+            self.metrics.timing('elasticdata.bulk.took', duration)
+        self.metrics.increment('elasticdata.bulk.items', count)
+        self.metrics.increment('elasticdata.bulk.rejected', rejected)
+        self.metrics.gauge('elasticdata.bulk.chunk_size', self.chunk_size)
+        self.metrics.gauge('elasticdata.bulk.chunk_bytes', self.chunk_bytes)
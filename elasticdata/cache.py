@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import math
+import time
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class BaseQueryCache(object):
+    """ Caches raw search responses, invalidated per type by bumping type generation which is part of key
+
+        Written documents are searchable after index refresh, so responses of invalidated type aren't
+        cached until it's done, otherwise old data could be cached under new generation.
+        :param ttl: time in seconds for which response is kept
+        :param refresh_interval: refresh interval of indices in seconds
+    """
+    def __init__(self, ttl=60, refresh_interval=1.0):
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+
+    def make_key(self, type_name, index, query, scope=None, params=None):
+        normalized = json.dumps([index, query, scope, params], sort_keys=True, default=repr)
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        return '{type}:{generation}:{digest}'.format(
+            type=type_name, generation=self.get_generation(type_name), digest=digest)
+
+    def invalidate(self, type_names, delay=None):
+        """ Invalidates responses of types
+            :param delay: time in seconds after which writes are searchable, refresh_interval by default,
+                0 when indices were already refreshed
+        """
+        delay = self.refresh_interval if delay is None else delay
+        for type_name in type_names:
+            self.bump_generation(type_name)
+            if delay > 0:
+                self.set_unsettled(type_name, delay)
+
+    def is_cacheable(self, type_name):
+        """ Returns False when writes of type may not be searchable yet """
+        return not self.is_unsettled(type_name)
+
+    def get(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def get_generation(self, type_name):
+        raise NotImplementedError()
+
+    def bump_generation(self, type_name):
+        raise NotImplementedError()
+
+    def set_unsettled(self, type_name, delay):
+        raise NotImplementedError()
+
+    def is_unsettled(self, type_name):
+        raise NotImplementedError()
+
+
+class LocMemQueryCache(BaseQueryCache):
+    """ Process local cache with least recently used eviction
+        :param max_size: maximal number of cached responses
+    """
+    def __init__(self, ttl=60, max_size=1000, refresh_interval=1.0):
+        super(LocMemQueryCache, self).__init__(ttl, refresh_interval)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._generations = {}
+        self._unsettled = {}
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            expires, value = self._data.pop(key)
+            if expires < time.time():
+                return None
+            self._data[key] = (expires, value)
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.ttl, copy.deepcopy(value))
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_generation(self, type_name):
+        return self._generations.get(type_name, 0)
+
+    def bump_generation(self, type_name):
+        with self._lock:
+            self._generations[type_name] = self._generations.get(type_name, 0) + 1
+
+    def set_unsettled(self, type_name, delay):
+        with self._lock:
+            self._unsettled[type_name] = max(self._unsettled.get(type_name, 0), time.time() + delay)
+
+    def is_unsettled(self, type_name):
+        return self._unsettled.get(type_name, 0) > time.time()
+
+
+class DjangoQueryCache(BaseQueryCache):
+    """ Cache stored in django cache backend, shared between processes when backend is
+        :param alias: name of cache in CACHES setting
+    """
+    def __init__(self, ttl=60, alias='default', prefix='elasticdata', refresh_interval=1.0):
+        from django.core.cache import get_cache
+        super(DjangoQueryCache, self).__init__(ttl, refresh_interval)
+        self.cache = get_cache(alias)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.cache.get(self.prefix + ':' + key)
+
+    def set(self, key, value):
+        self.cache.set(self.prefix + ':' + key, value, self.ttl)
+
+    def get_generation(self, type_name):
+        return self.cache.get(self._generation_key(type_name), 0)
+
+    def bump_generation(self, type_name):
+        key = self._generation_key(type_name)
+        if not self.cache.add(key, 1, None):
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 1, None)
+
+    def set_unsettled(self, type_name, delay):
+        self.cache.set(self._unsettled_key(type_name), True, int(math.ceil(delay)))
+
+    def is_unsettled(self, type_name):
+        return bool(self.cache.get(self._unsettled_key(type_name)))
+
+    def _unsettled_key(self, type_name):
+        return '{prefix}:unsettled:{type}'.format(prefix=self.prefix, type=type_name)
+
+    def _generation_key(self, type_name):
+        return '{prefix}:generation:{type}'.format(prefix=self.prefix, type=type_name)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import six
+from datetime import datetime, date
+from elasticsearch import helpers, TransportError
+
+from .type import parse_date
+from .manager import RepositoryError
+
+try:
+    import numpy
+except ImportError:  # numpy is optional dependency
+    numpy = None
+
+INTEGER_TYPES = ('long', 'integer', 'short', 'byte')
+FLOAT_TYPES = ('double', 'float')
+
+
+def get_field_types(_type, fields):
+    """ Returns mapping type of every field, None for fields without declared mapping """
+    properties = _type.get_mapping()['properties']
+    types = dict((field, properties.get(field, {}).get('type')) for field in fields)
+    if _type._meta['timestamps']:
+        for field in ('created_at', 'updated_at'):
+            if field in types:
+                types[field] = types[field] or 'date'
+    return types
+
+
+def get_field_hooks(_type, fields):
+    """ Returns get_<field> methods of type, which convert stored values like in to_representation """
+    entity = _type()
+    return dict((field, getattr(entity, 'get_' + field)) for field in fields if hasattr(entity, 'get_' + field))
+
+
+def to_array(values, field_type=None):
+    """ Converts values to numpy array, missing values become NaN, NaT or None
+
+        Dates are stored as iso strings (repr_ hooks of types usually store them so) and parsed like other dates
+        of types. Without mapping type, field is a date when all its values are datetimes or such strings.
+        :param field_type: mapping type of field, dtype is guessed from values when not given
+    """
+    if field_type == 'date' or (field_type is None and _are_dates(values)):
+        return numpy.array([parse_date(value) for value in values], dtype='datetime64[ms]')
+    if field_type in FLOAT_TYPES:
+        return numpy.array([numpy.nan if value is None else value for value in values], dtype='float64')
+    if field_type in INTEGER_TYPES or field_type is None:
+        present = [value for value in values if value is not None]
+        numeric = all(isinstance(value, six.integer_types + (float, )) and not isinstance(value, bool)
+                      for value in present)
+        if field_type is not None or (present and numeric):
+            if len(present) == len(values) and all(isinstance(value, six.integer_types) for value in present):
+                return numpy.array(values, dtype='int64')
+            return numpy.array([numpy.nan if value is None else value for value in values], dtype='float64')
+    if field_type == 'boolean':
+        if None not in values:
+            return numpy.array(values, dtype='bool')
+    array = numpy.empty(len(values), dtype='object')
+    array[:] = values
+    return array
+
+
+def hits_to_columns(hits, fields, field_types, batch_size=10000, hooks=None):
+    """ Builds arrays from iterable of hits in batches of batch_size hits
+        :param hooks: dictionary of functions converting stored values of fields
+    """
+    hooks = hooks or {}
+    batches = dict((field, []) for field in ['id'] + list(fields))
+    columns = dict((field, []) for field in batches)
+    for hit in hits:
+        source = hit.get('_source', {})
+        columns['id'].append(hit['_id'])
+        for field in fields:
+            value = source.get(field)
+            columns[field].append(hooks[field](value) if field in hooks else value)
+        if len(columns['id']) >= batch_size:
+            for field, values in six.iteritems(columns):
+                batches[field].append(to_array(values, field_types.get(field)))
+                columns[field] = []
+    for field, values in six.iteritems(columns):
+        if values or not batches[field]:
+            batches[field].append(to_array(values, field_types.get(field)))
+    return dict((field, _concatenate(arrays)) for field, arrays in six.iteritems(batches))
+
+
+def query_columns(client, index, query, _type, scope=None, fields=None, scan=False, record=False,
+                  batch_size=10000, **kwargs):
+    """ Returns dictionary of numpy arrays (or record array) with values of fields from query hits
+
+        No entities are built, but get_<field> methods of type are applied to values. Column id holds document
+        ids.
+        :param fields: fields to fetch, fields of scope by default
+        :param scan: fetch all matching documents with scan and scroll instead of one search
+    """
+    if numpy is None:
+        raise RepositoryError('Columnar queries require numpy')
+    fields = list(fields or _type.get_fields(scope) or [])
+    if not fields:
+        raise RepositoryError('Columnar queries require fields or scope')
+    params = {'index': index, 'doc_type': _type.get_type(), '_source': fields}
+    params.update(kwargs)
+    try:
+        if scan:
+            hits = helpers.scan(client, query=query, **params)
+        else:
+            hits = client.search(body=query, **params)['hits']['hits']
+        columns = hits_to_columns(hits, fields, get_field_types(_type, fields), batch_size,
+                                  get_field_hooks(_type, fields))
+    except TransportError as e:
+        raise RepositoryError('Transport returned error', cause=e)
+    if record:
+        names = ['id'] + fields
+        return numpy.rec.fromarrays([columns[name] for name in names], names=[str(name) for name in names])
+    return columns
+
+
+def _are_dates(values):
+    present = [value for value in values if value is not None]
+    if not present:
+        return False
+    for value in present:
+        if isinstance(value, six.string_types):
+            if parse_date(value) is None:
+                return False
+        elif not isinstance(value, (datetime, date)):
+            return False
+    return True
+
+
+def _concatenate(arrays):
+    if len(arrays) == 1:
+        return arrays[0]
+    if len(set(array.dtype for array in arrays)) > 1:
+        #  Batches may guess different dtypes, e.g. int64 and float64 with NaN.
+        kinds = set(array.dtype.kind for array in arrays)
+        dtype = 'float64' if kinds <= set('if') else 'object'
+        arrays = [array.astype(dtype) for array in arrays]
+    return numpy.concatenate(arrays)
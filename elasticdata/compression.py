@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import zlib
+from six import text_type
+from urllib3.exceptions import ReadTimeoutError, SSLError as UrllibSSLError
+from elasticsearch import Urllib3HttpConnection
+from elasticsearch.compat import urlencode
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout, SSLError
+
+from .metrics import null_metrics
+
+
+def get_client_settings(es_settings):
+    """ Returns settings of Elasticsearch client, using compressed connection when they contain compression
+
+        Compression is True or dictionary with threshold (in bytes), level and metrics, e.g.
+        ELASTICSEARCH_CONFIG = {'hosts': [...], 'compression': {'threshold': 4096}}
+    """
+    es_settings = dict(es_settings or {})
+    if es_settings.get('compression'):
+        es_settings.setdefault('connection_class', CompressedHttpConnection)
+    else:
+        es_settings.pop('compression', None)
+    return es_settings
+
+
+class CompressedHttpConnection(Urllib3HttpConnection):
+    """ Connection sending gzipped request bodies bigger than threshold and accepting gzipped responses
+
+        Elasticsearch decompresses requests on its own, responses are compressed when http.compression is
+        enabled on cluster. Sizes and times of compression are reported as elasticdata.transport.* metrics.
+        :param compression: True or dictionary with threshold, level and metrics
+    """
+    def __init__(self, compression=True, **kwargs):
+        super(CompressedHttpConnection, self).__init__(**kwargs)
+        options = compression if isinstance(compression, dict) else {}
+        self.threshold = options.get('threshold', 1024)
+        self.level = options.get('level', 6)
+        self.metrics = options.get('metrics') or null_metrics
+        self.headers['accept-encoding'] = 'gzip,deflate'
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=()):
+        url = self.url_prefix + url
+        if params:
+            url = '%s?%s' % (url, urlencode(params))
+        full_url = self.host + url
+        headers = self.headers
+        data = body
+        if body is not None:
+            if isinstance(data, text_type):
+                data = data.encode('utf-8')
+            if len(data) >= self.threshold:
+                data = self.compress(data)
+                headers = dict(headers)
+                headers['content-encoding'] = 'gzip'
+
+        start = time.time()
+        try:
+            kw = {}
+            if timeout:
+                kw['timeout'] = timeout
+            #  Url and method can't be unicode in python 2, like in Urllib3HttpConnection.
+            if not isinstance(url, str):
+                url = url.encode('utf-8')
+            if not isinstance(method, str):
+                method = method.encode('utf-8')
+            response = self.pool.urlopen(method, url, data, retries=False, headers=headers, decode_content=False,
+                                         **kw)
+            duration = time.time() - start
+            raw_data = self.decompress(response.data, response.headers.get('content-encoding')).decode('utf-8')
+        except UrllibSSLError as e:
+            self.log_request_fail(method, full_url, body, time.time() - start, exception=e)
+            raise SSLError('N/A', str(e), e)
+        except ReadTimeoutError as e:
+            self.log_request_fail(method, full_url, body, time.time() - start, exception=e)
+            raise ConnectionTimeout('TIMEOUT', str(e), e)
+        except Exception as e:
+            self.log_request_fail(method, full_url, body, time.time() - start, exception=e)
+            raise ConnectionError('N/A', str(e), e)
+
+        if not (200 <= response.status < 300) and response.status not in ignore:
+            self.log_request_fail(method, url, body, duration, response.status)
+            self._raise_error(response.status, raw_data)
+
+        self.log_request_success(method, full_url, url, body, response.status, raw_data, duration)
+        return response.status, response.headers, raw_data
+
+    def compress(self, data):
+        started = time.time()
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush()
+        self.metrics.timing('elasticdata.transport.compress_time', time.time() - started)
+        self._report('request', len(data), len(compressed))
+        return compressed
+
+    def decompress(self, data, encoding):
+        if encoding not in ('gzip', 'deflate'):
+            return data
+        started = time.time()
+        decompressed = zlib.decompress(data, 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS)
+        self.metrics.timing('elasticdata.transport.decompress_time', time.time() - started)
+        self._report('response', len(decompressed), len(data))
+        return decompressed
+
+    def _report(self, direction, size, compressed_size):
+        self.metrics.increment('elasticdata.transport.{direction}_bytes'.format(direction=direction), size)
+        self.metrics.increment(
+            'elasticdata.transport.{direction}_compressed_bytes'.format(direction=direction), compressed_size)
+        if size:
+            self.metrics.gauge('elasticdata.transport.{direction}_ratio'.format(direction=direction),
+                               float(compressed_size) / size)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+from contextlib import contextmanager
+
+from . import get_shared_client, get_shared_read_client, get_shared_read_pin, get_index
+from .manager import EntityManager, RepositoryError
+
+#  With gevent monkey patching threading.local is greenlet local, so every greenlet has own managers.
+_local = threading.local()
+
+
+def _managers():
+    if not hasattr(_local, 'managers'):
+        _local.managers = []
+    return _local.managers
+
+
+def open_scope(index=None, es_settings=None, read_es_settings=None, **kwargs):
+    """ Creates entity manager backed by shared clients and makes it current for this thread
+
+        Reads go to shared read client and are pinned by shared ReadPin, when they are configured.
+    """
+    kwargs.setdefault('read_client', get_shared_read_client(read_es_settings))
+    kwargs.setdefault('pin_reads', get_shared_read_pin())
+    em = EntityManager(index=get_index(index), client=get_shared_client(es_settings), **kwargs)
+    _managers().append(em)
+    return em
+
+
+def close_scope(em, flush=False):
+    """ Optionally flushes entity manager and clears it, can be called many times for the same manager """
+    managers = _managers()
+    if em not in managers:
+        return
+    managers.remove(em)
+    try:
+        if flush:
+            em.flush()
+    finally:
+        em.clear()
+
+
+def current_entity_manager():
+    """ Returns entity manager of innermost open scope in this thread """
+    managers = _managers()
+    if not managers:
+        raise RepositoryError('There is no entity manager scope open')
+    return managers[-1]
+
+
+@contextmanager
+def entity_manager_scope(index=None, es_settings=None, flush=False, read_es_settings=None, **kwargs):
+    """ Provides scoped entity manager, cleared on exit and flushed when flush is set and no error occurred """
+    em = open_scope(index, es_settings, read_es_settings, **kwargs)
+    succeeded = False
+    try:
+        yield em
+        succeeded = True
+    finally:
+        close_scope(em, flush=flush and succeeded)
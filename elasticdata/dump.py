@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+import json
+import gzip
+import time
+import threading
+from elasticsearch import helpers
+
+from .manager import RepositoryError
+from .reindex import hit_to_action
+
+
+def open_dump(path, mode='r'):
+    """ Opens dump file in binary mode, files with .gz extension are gzipped """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 'b')
+    return io.open(path, mode + 'b')
+
+
+class Progress(object):
+    """ Reports number of processed documents and processing rate every `every` documents
+        :param callback: callable receiving count and rate in documents per second
+    """
+    def __init__(self, callback, every=1000):
+        self.callback = callback
+        self.every = every
+        self.count = 0
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, num=1):
+        with self._lock:
+            previous, self.count = self.count, self.count + num
+            if previous // self.every != self.count // self.every:
+                self.report()
+
+    def report(self):
+        elapsed = time.time() - self._started
+        self.callback(self.count, self.count / elapsed if elapsed else 0.0)
+
+
+def dump(client, fileobj, index, doc_type=None, query=None, scroll='5m', progress=None):
+    """ Writes documents from index as newline delimited bulk index actions
+        :param fileobj: file opened in binary mode
+        :param progress: Progress instance
+        :return: number of written documents
+    """
+    hits = helpers.scan(client, query=query, scroll=scroll, index=index, doc_type=doc_type,
+                        fields='_source,_routing,_parent')
+    count = 0
+    for hit in hits:
+        action = hit_to_action(hit, hit['_index'])
+        fileobj.write(json.dumps(action).encode('utf-8') + b'\n')
+        count += 1
+        if progress is not None:
+            progress.add()
+    return count
+
+
+def read_actions(fileobj, index=None):
+    """ Reads bulk actions written by dump
+        :param index: index overriding index stored in dump
+    """
+    for line in fileobj:
+        line = line.strip()
+        if not line:
+            continue
+        action = json.loads(line.decode('utf-8'))
+        if index is not None:
+            action['_index'] = index
+        yield action
+
+
+def load(client, fileobj, index=None, chunk_size=500, threads=1, progress=None):
+    """ Loads dump into elasticsearch using streaming bulk in parallel threads
+        :param fileobj: file opened in binary mode
+        :param index: index overriding index stored in dump
+        :param progress: Progress instance
+        :return: tuple with number of loaded documents and list of errors
+    """
+    actions = read_actions(fileobj, index)
+    lock = threading.Lock()
+    results = {'count': 0, 'errors': [], 'exceptions': []}
+
+    def next_actions():
+        while True:
+            with lock:
+                try:
+                    action = next(actions)
+                except StopIteration:
+                    return
+            yield action
+
+    def worker():
+        try:
+            for ok, item in helpers.streaming_bulk(client, next_actions(), chunk_size=chunk_size,
+                                                   raise_on_error=False):
+                with lock:
+                    if ok:
+                        results['count'] += 1
+                    else:
+                        results['errors'].append(item)
+                if progress is not None:
+                    progress.add()
+        except Exception as e:
+            with lock:
+                results['exceptions'].append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if results['exceptions']:
+        raise RepositoryError('Load failed', cause=results['exceptions'][0])
+    return results['count'], results['errors']
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from importlib import import_module
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import module_has_submodule
+
+from elasticdata import get_client, get_index
+from elasticdata.type import TypeMeta
+from elasticdata.dump import open_dump, dump, Progress
+
+
+TYPE_MODULES = ('types', 'repositories')
+
+
+def load_type_modules():
+    """ Imports modules of installed apps which usually define types, so they are registered """
+    for app in settings.INSTALLED_APPS:
+        package = import_module(app)
+        for name in TYPE_MODULES:
+            if module_has_submodule(package, name):
+                import_module(app + '.' + name)
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Dumps index or documents of one type to newline delimited json file, gzipped when file ends with .gz'
+    option_list = BaseCommand.option_list + (
+        make_option('--index', dest='index', default=None, help='Index to dump, ELASTICSEARCH_INDEX by default'),
+        make_option('--type', dest='type', default=None,
+                    help='Name of type to dump, names not matching any Type are used as document types'),
+        make_option('--query', dest='query', default=None, help='Query in json limiting dumped documents'),
+        make_option('--scroll', dest='scroll', default='5m', help='Scroll timeout'),
+        make_option('--progress-every', dest='progress_every', type='int', default=10000,
+                    help='Report progress every given number of documents'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: es_dump {args}'.format(args=self.args))
+        index = get_index(options['index'])
+        doc_type = None
+        if options['type']:
+            load_type_modules()
+            _type = TypeMeta.registry.get(options['type'])
+            if _type is not None:
+                index, doc_type = _type.get_index(index), _type.get_type()
+            else:
+                doc_type = options['type']
+        query = json.loads(options['query']) if options['query'] else None
+        progress = Progress(self.report, every=options['progress_every'])
+        with open_dump(args[0], 'w') as f:
+            dump(get_client(), f, index, doc_type=doc_type, query=query, scroll=options['scroll'],
+                 progress=progress)
+        progress.report()
+
+    def report(self, count, rate):
+        self.stdout.write('{count} documents dumped ({rate:.0f} docs/s)'.format(count=count, rate=rate))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+
+from elasticdata import get_client
+from elasticdata.dump import open_dump, load, Progress
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Loads newline delimited json file created by es_dump'
+    option_list = BaseCommand.option_list + (
+        make_option('--index', dest='index', default=None, help='Index overriding indices stored in file'),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=500,
+                    help='Number of documents in one bulk request'),
+        make_option('--threads', dest='threads', type='int', default=1, help='Number of parallel bulk requests'),
+        make_option('--progress-every', dest='progress_every', type='int', default=10000,
+                    help='Report progress every given number of documents'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: es_load {args}'.format(args=self.args))
+        progress = Progress(self.report, every=options['progress_every'])
+        with open_dump(args[0], 'r') as f:
+            count, errors = load(get_client(), f, index=options['index'], chunk_size=options['chunk_size'],
+                                 threads=options['threads'], progress=progress)
+        progress.report()
+        if errors:
+            raise CommandError('{num} documents failed to load, first error: {error}'.format(
+                num=len(errors), error=errors[0]))
+
+    def report(self, count, rate):
+        self.stdout.write('{count} documents loaded ({rate:.0f} docs/s)'.format(count=count, rate=rate))
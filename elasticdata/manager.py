@@ -3,14 +3,22 @@ from __future__ import unicode_literals
 
 import six
 import copy
+import uuid
 from importlib import import_module
 from django.conf import settings
 from elasticsearch import Elasticsearch, helpers, TransportError
+from elasticsearch.helpers import BulkIndexError
 from datetime import datetime
 
 from .repository import BaseRepository
+from .refresh import COALESCE, WAIT, default_coalescer
+from .pagination import (normalize_sort, with_tie_breaker, is_score_sorted, after_filter, encode_cursor,
+                         decode_cursor)
+from .replicas import ReplicaSet, ReadPin, create_read_client
+from .compression import get_client_settings
 
-ADD, UPDATE, REMOVE = range(3)
+ADD, UPDATE, REMOVE, MERGE = range(4)
+CONFLICT = 409
 
 
 def group(data, type_getter):
@@ -57,14 +65,16 @@ class EntityNotFound(RepositoryError):
 
 
 class PersistedEntity(object):
-    def __init__(self, entity, state=ADD, index='default'):
+    def __init__(self, entity, state=ADD, index='default', on_change=None):
         self._initial_value = {}
         self._entity = entity
+        self._on_change = on_change
         self.state = self.last_state = state
         if state == UPDATE:
             self.reset_state()
         self._index = index
         self._diff = None
+        self.derived_id = False
         entity._persisted_entity = self
 
     @property
@@ -75,6 +85,8 @@ class PersistedEntity(object):
             return self._update()
         elif self.state == REMOVE:
             return self._remove()
+        elif self.state == MERGE:
+            return self._merge()
 
     def is_action_needed(self):
         if self.state == UPDATE:
@@ -82,7 +94,7 @@ class PersistedEntity(object):
                 return False
             if self.diff is None:
                 return False
-        elif self.state == REMOVE:
+        elif self.state in (REMOVE, MERGE):
             if 'id' not in self._entity:
                 return False
         return True
@@ -101,31 +113,77 @@ class PersistedEntity(object):
         self.state = UPDATE  # TODO what when item is removed?
         self._diff = None
 
+    @property
+    def index(self):
+        if '_index' in self._entity:
+            return self._entity['_index']
+        if hasattr(self._entity, 'get_storage_index'):
+            return self._entity.get_storage_index(self._index)
+        return self._index
+
+    def mark_dirty(self):
+        self._diff = None
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def has_nested_values(self):
+        """ Nested lists and dicts can be changed in place, without notifying about change
+
+            Values of entity are checked too, as repr_ hooks may store them in other form. Writes bypassing
+            __setitem__ (e.g. to _data) are noticed only for entities with nested values, others have to be
+            marked dirty.
+        """
+        values = list(six.itervalues(self._initial_value))
+        if hasattr(self._entity, '_data'):
+            values.extend(value for key, value in six.iteritems(self._entity._data) if not key.startswith('_'))
+        return any(isinstance(value, (list, dict)) for value in values)
+
+    def merge_loaded(self, keys):
+        """ Adds values of fields loaded later to initial state, so they are not seen as changed """
+        storage = self._entity.to_storage()
+        for key in keys:
+            if key in storage:
+                self._initial_value[key] = copy.deepcopy(storage[key])
+        #  Scoped fields missing in document were stored as None.
+        for key in [k for k, v in six.iteritems(self._initial_value) if v is None and k not in storage]:
+            del self._initial_value[key]
+        self._diff = None
+
+    def get_key_id(self):
+        return self._entity.get_key_id() if hasattr(self._entity, 'get_key_id') else None
+
     def set_id(self, _id):
-        self._entity['id'] = _id
+        self._set_field('id', _id)
+
+    def set_index(self, index):
+        self._set_field('_index', index)
 
     def _add(self):
         if self._entity._meta['timestamps']:
             now = datetime.now()
-            self._entity['created_at'] = now
-            self._entity['updated_at'] = now
+            self._set_field('created_at', now)
+            self._set_field('updated_at', now)
         source = self._entity.to_storage()
         stmt = {
             '_op_type': 'create',
-            '_index': self._index,
+            '_index': self.index,
             '_type': self._entity.type,
         }
         if 'id' in source:
             stmt['_id'] = source['id']
             del source['id']
-        if '_parent' in self._entity:
-            stmt['_parent'] = self._entity['_parent']
+        else:
+            key_id = self.get_key_id()
+            if key_id is not None:
+                stmt['_id'] = key_id
+                self.derived_id = True
+        self._set_routing(stmt)
         stmt['_source'] = source
         return stmt
 
     def _update(self):
         if self._entity._meta['timestamps']:
-            self._entity['updated_at'] = datetime.now()
+            self._set_field('updated_at', datetime.now())
         self._update_diff()
         if not self.diff:
             return None
@@ -134,25 +192,73 @@ class PersistedEntity(object):
             del diff['_parent']
         stmt = {
             '_op_type': 'update',
-            '_index': self._index,
+            '_index': self.index,
             '_type': self._entity.type,
             '_id': self._entity['id'],
             'doc': diff
         }
-        if '_parent' in self._entity:
-            stmt['_parent'] = self._entity['_parent']
+        self._set_routing(stmt)
         return stmt
 
     def _remove(self):
         stmt = {
             '_op_type': 'delete',
-            '_index': self._index,
+            '_index': self.index,
             '_type': self._entity.type,
             '_id': self._entity['id'],
         }
+        self._set_routing(stmt)
+        return stmt
+
+    def _merge(self):
+        upsert_created_at = False
+        if self._entity._meta['timestamps']:
+            now = datetime.now()
+            self._set_field('updated_at', now)
+            if 'created_at' not in self._entity:
+                upsert_created_at = True
+                self._set_field('created_at', now)
+        source = self._entity.to_storage()
+        stmt = {
+            '_op_type': 'update',
+            '_index': self.index,
+            '_type': self._entity.type,
+            '_id': self._entity['id'],
+        }
+        if 'id' in source:
+            del source['id']
+        if upsert_created_at:
+            stmt['upsert'] = dict(source)
+            del source['created_at']
+            #  Merged document may exist already, so its creation time isn't known.
+            self._unset_field('created_at')
+        if 'upsert' not in stmt:
+            stmt['doc_as_upsert'] = True
+        self._set_routing(stmt)
+        stmt['doc'] = source
+        return stmt
+
+    def _set_field(self, key, value):
+        """ Sets field managed by manager itself without marking entity as changed """
+        if hasattr(self._entity, '_data'):
+            self._entity._data[key] = value
+            self._diff = None
+        else:
+            self._entity[key] = value
+
+    def _unset_field(self, key):
+        if hasattr(self._entity, '_data'):
+            self._entity._data.pop(key, None)
+            self._diff = None
+        else:
+            del self._entity[key]
+
+    def _set_routing(self, stmt):
         if '_parent' in self._entity:
             stmt['_parent'] = self._entity['_parent']
-        return stmt
+        routing = self._entity.get_routing() if hasattr(self._entity, 'get_routing') else None
+        if routing is not None:
+            stmt['_routing'] = routing
 
     def _update_diff(self):
         current_state = self._entity.to_storage()
@@ -167,18 +273,144 @@ class PersistedEntity(object):
         self._diff = diff or None
 
 
+class AtomicUpdate(object):
+    """ Scripted update of single field sent without fetching document
+
+        Scripts are inline groovy, which requires dynamic scripting enabled on cluster
+        (script.disable_dynamic: false since elasticsearch 1.4.3). Otherwise put scripts to config/scripts
+        and name them in SCRIPT_FILES, e.g. {'increment': 'elasticdata_increment'}. They get field and value
+        params.
+    """
+    LANG = 'groovy'
+    SCRIPT_FILES = {}
+    SCRIPTS = {
+        'increment': 'ctx._source[field] = (ctx._source[field] ?: 0) + value',
+        'set_if_absent': 'if (ctx._source.containsKey(field)) { ctx.op = "none" } '
+                         'else { ctx._source[field] = value }',
+        'append': 'if (ctx._source[field] == null) { ctx._source[field] = [value] } '
+                  'else { ctx._source[field] += value }',
+        'remove': 'if (ctx._source[field] != null) { ctx._source[field].removeAll([value]) }',
+    }
+
+    def __init__(self, operation, _id, _type, field, value, index='default', parent=None, upsert=None,
+                 routing=None):
+        if operation not in self.SCRIPTS:
+            raise ValueError('Unknown atomic operation {operation}'.format(operation=operation))
+        self.operation = operation
+        self._id = _id
+        self._type = _type
+        self._index = index
+        self._parent = parent
+        self._routing = routing
+        self.field = field
+        self.value = value
+        self.upsert = upsert
+
+    @property
+    def stmt(self):
+        stmt = {
+            '_op_type': 'update',
+            '_index': self._index,
+            '_type': self._type,
+            '_id': self._id,
+            'lang': self.LANG,
+            'params': {'field': self.field, 'value': self.value}
+        }
+        if self.operation in self.SCRIPT_FILES:
+            stmt['script_file'] = self.SCRIPT_FILES[self.operation]
+        else:
+            stmt['script'] = self.SCRIPTS[self.operation]
+        if self._parent is not None:
+            stmt['_parent'] = self._parent
+        if self._routing is not None:
+            stmt['_routing'] = self._routing
+        if self.upsert is not None:
+            stmt['upsert'] = self.upsert
+        return stmt
+
+
+class DeferredLoader(object):
+    """ Loads fields missing from scoped entities of one result set with single mget
+
+        Entities are unscoped after loading, so their all fields are persisted.
+    """
+    def __init__(self, em, _type, entities):
+        self._em = em
+        self._type = _type
+        self._entities = entities
+        for entity in entities:
+            entity._deferred = self
+
+    def load(self):
+        entities = dict((entity['id'], entity) for entity in self._entities if entity._deferred is self)
+        docs = []
+        for entity in six.itervalues(entities):
+            doc = {'_id': entity['id'], '_index': entity['_index']}
+            if '_routing' in entity:
+                doc['_routing'] = entity['_routing']
+            elif '_parent' in entity:
+                doc['_routing'] = entity['_parent']
+            docs.append(doc)
+        try:
+            data = self._em.get_read_client(_type=self._type).mget(
+                body={'docs': docs}, doc_type=self._type.get_type())
+        except TransportError as e:
+            raise RepositoryError('Loading deferred fields failed', cause=e)
+        for doc in data['docs']:
+            entity = entities[doc['_id']]
+            entity._deferred = None
+            if not doc.get('found'):
+                continue
+            keys = [key for key in doc['_source'] if key not in entity._data]
+            for key in keys:
+                entity._data[key] = doc['_source'][key]
+            entity._scope = None
+            persisted_entity = getattr(entity, '_persisted_entity', None)
+            if persisted_entity is not None:
+                persisted_entity.merge_loaded(keys)
+                #  Entities forgotten by manager (e.g. after clear) stay untracked.
+                if self._em._registry.get(id(entity)) is persisted_entity:
+                    self._em._track(persisted_entity)
+        for entity in six.itervalues(entities):
+            entity._deferred = None
+
+
 class EntityManager(object):
     @staticmethod
     def entity_not_found_message(en_type, ids):
         return 'Entities: "{type}" with ids: {ids} not found.'.format(type=en_type, ids=ids)
 
-    def __init__(self, index='default', es_settings=None):
-        if es_settings:
-            self.es = Elasticsearch(**es_settings)
+    def __init__(self, index='default', es_settings=None, refresh=False, refresh_coalescer=None, client=None,
+                 query_cache=None, bulk_sender=None, write_behind=None, read_client=None, read_es_settings=None,
+                 pin_reads=0):
+        """ Manager writes to client given by client or es_settings, reads go to read client when given
+            :param read_client: client or ReplicaSet used for reads
+            :param read_es_settings: settings of read client, list of settings creates ReplicaSet
+            :param pin_reads: for how many seconds after flush reads of written types go to write client,
+                or ReadPin shared with other managers
+        """
+        if client is not None:
+            self.es = client
+        elif es_settings:
+            self.es = Elasticsearch(**get_client_settings(es_settings))
         else:
             self.es = Elasticsearch()
+        if read_client is None and read_es_settings:
+            read_client = create_read_client(read_es_settings)
+        self._read_es = read_client
+        if pin_reads and not isinstance(pin_reads, ReadPin):
+            pin_reads = ReadPin(pin_reads)
+        self._read_pin = pin_reads or None
         self._index = index
+        self._refresh = refresh
+        self._refresh_coalescer = refresh_coalescer or default_coalescer
+        self._query_cache = query_cache
+        self._bulk_sender = bulk_sender
+        self._write_behind = write_behind
         self._registry = {}
+        self._pending = set()
+        self._watched = set()
+        self._operations = []
 
     def persist(self, entity):
         if not hasattr(entity, 'to_storage') or not hasattr(entity, '__getitem__') or not hasattr(entity, 'type'):
@@ -188,50 +420,140 @@ class EntityManager(object):
     def remove(self, entity):
         self._persist(entity, state=REMOVE)
 
-    def flush(self, refresh=False):
-        actions = []
-        for persisted_entity in six.itervalues(self._registry):
-            if persisted_entity.is_action_needed():
-                actions.append(persisted_entity)
+    def merge(self, entity):
+        if not hasattr(entity, 'to_storage') or not hasattr(entity, '__getitem__') or not hasattr(entity, 'type'):
+            raise TypeError('entity object must have to_storage, type and behave like a dict methods')
+        if 'id' not in entity:
+            raise RepositoryError('Merged entity must have an id')
+        self._persist(entity, state=MERGE)
+
+    def increment(self, entity, field, value=1, _type=None, upsert=None, routing=None):
+        self._queue_operation('increment', entity, field, value, _type, upsert, routing)
+
+    def set_if_absent(self, entity, field, value, _type=None, upsert=None, routing=None):
+        self._queue_operation('set_if_absent', entity, field, value, _type, upsert, routing)
+
+    def append_to(self, entity, field, value, _type=None, upsert=None, routing=None):
+        self._queue_operation('append', entity, field, value, _type, upsert, routing)
+
+    def remove_from(self, entity, field, value, _type=None, routing=None):
+        self._queue_operation('remove', entity, field, value, _type, None, routing)
+
+    def flush(self, refresh=None, background=None):
+        """ Sends all pending changes to elasticsearch
+            :param refresh: True refreshes index in bulk request, COALESCE schedules shared refresh,
+                WAIT schedules shared refresh and blocks until it's done. Defaults to manager setting.
+            :param background: hand statements to write behind queue of this manager instead of sending them,
+                new entities get generated ids then and refresh is ignored. By default used when manager has
+                queue.
+        """
+        if refresh is None:
+            refresh = self._refresh
+        if background is None:
+            background = self._write_behind is not None
+        elif background and self._write_behind is None:
+            raise RepositoryError('Background flush requires write behind queue')
+        candidates = self._pending | self._watched
+        actions = [persisted_entity for persisted_entity in candidates if persisted_entity.is_action_needed()]
+        operations, self._operations = self._operations, []
         self._execute_callbacks(actions, 'pre')
-        bulk_results = helpers.streaming_bulk(self.es, [a.stmt for a in actions], refresh=refresh)
-        # TODO: checking exceptions in bulk_results
+        if background:
+            for action in actions:
+                if action.state == ADD and 'id' not in action._entity:
+                    key_id = action.get_key_id()
+                    action.set_id(key_id or uuid.uuid4().hex)
+                    action.derived_id = key_id is not None
+        stmts = [a.stmt for a in actions] + [o.stmt for o in operations]
+        try:
+            if background:
+                self._write_behind.put(stmts, ignore_conflicts=set(
+                    position for position, action in enumerate(actions) if action.derived_id))
+                bulk_results = []
+            elif self._bulk_sender is not None:
+                bulk_results = list(self._bulk_sender.send(
+                    self.es, stmts, raise_on_error=False, refresh=refresh is True))
+            else:
+                bulk_results = list(helpers.streaming_bulk(
+                    self.es, stmts, raise_on_error=False, refresh=refresh is True))
+            self._check_bulk_results(actions, bulk_results)
+        except Exception:
+            #  Changes stay pending, so next flush sends them again.
+            self._operations = operations + self._operations
+            raise
         for persisted_entity, result in zip(actions, bulk_results):
             if 'create' in result[1]:
                 persisted_entity.set_id(result[1]['create']['_id'])
+                persisted_entity.set_index(result[1]['create']['_index'])
         for action in actions:
             action.reset_state()
+            self._track(action)
+        self._pending -= candidates
+        if self._read_pin is not None and stmts:
+            self._read_pin.pin(set((self._index, stmt['_type']) for stmt in stmts))
+        if refresh in (COALESCE, WAIT) and not background:
+            self._coalesce_refresh(set(stmt['_index'] for stmt in stmts), wait=refresh == WAIT)
+        if self._query_cache is not None and stmts:
+            #  Until writes are searchable, cache doesn't store responses of written types.
+            if background:
+                delay = self._query_cache.refresh_interval + self._write_behind.flush_interval
+            else:
+                delay = 0 if refresh in (True, WAIT) else None
+            self._query_cache.invalidate(set(stmt['_type'] for stmt in stmts), delay=delay)
         self._execute_callbacks(actions, 'post')
 
-    def find(self, _id, _type, scope=None, **kwargs):
-        params = {'id': _id, 'index': self._index, 'doc_type': _type.get_type()}
+    def find(self, _id, _type, scope=None, primary=None, **kwargs):
+        """ Returns entity of given type and id
+            :param primary: True reads from write client, False from read client even when reads are pinned
+        """
+        if _type.is_time_based():
+            entities = self._find_by_search([_id], _type, scope, primary=primary, **kwargs)
+            if not entities:
+                raise EntityNotFound(self.entity_not_found_message(_type.get_type(), _id))
+            return entities[0]
+        params = {'id': _id, 'index': _type.get_index(self._index), 'doc_type': _type.get_type()}
         if scope:
             params['_source'] = _type.get_fields(scope)
         params.update(kwargs)
         try:
-            _data = self.es.get(**params)
+            _data = self.get_read_client(primary, _type).get(**params)
         except TransportError as e:  # TODO: the might be other errors like server unavaliable
             raise EntityNotFound(self.entity_not_found_message(_type.get_type(), _id), e)
         if not _data['found']:
             raise EntityNotFound(self.entity_not_found_message(_type.get_type(), _id))
         source = _data['_source']
         source['id'] = _data['_id']
+        source['_index'] = _data['_index']
+        self._set_routing(source, _data, params.get('routing'))
         entity = _type(source, scope)
         self._persist(entity, state=UPDATE)
+        self._defer([entity], _type, scope)
         return entity
 
-    def find_many(self, _ids, _type, scope=None, complete_data=True, **kwargs):
+    def find_many(self, _ids, _type, scope=None, complete_data=True, primary=None, **kwargs):
         try:
             _ids = list(_ids)
         except TypeError as e:
             raise RepositoryError('Variable _ids has to be iterable', cause=e)
 
-        params = {'body': {'ids': _ids}, 'index': self._index, 'doc_type': _type.get_type()}
+        if _type.is_time_based():
+            entities = self._find_by_search(_ids, _type, scope, primary=primary, **kwargs)
+            if complete_data and len(entities) != len(set(_ids)):
+                found = set(entity['id'] for entity in entities)
+                invalid_items = [_id for _id in _ids if _id not in found]
+                raise EntityNotFound(self.entity_not_found_message(_type.get_type(), ', '.join(invalid_items)))
+            return entities
+
+        routing = kwargs.pop('routing', None)
+        params = {'body': {'ids': _ids}, 'index': _type.get_index(self._index), 'doc_type': _type.get_type()}
+        if isinstance(routing, dict):
+            params['body'] = {'docs': [{'_id': _id, '_routing': routing[_id]} for _id in _ids]}
+        elif routing is not None:
+            params['routing'] = routing
         if scope:
             params['_source'] = _type.get_fields(scope)
         params.update(kwargs)
         try:
-            _data = self.es.mget(**params)
+            _data = self.get_read_client(primary, _type).mget(**params)
         except TransportError as e:  # TODO: the might be other errors like server unavaliable
             raise EntityNotFound(self.entity_not_found_message(_type.get_type(), ', '.join(_ids)), e)
         entities = []
@@ -243,32 +565,114 @@ class EntityManager(object):
             if _entity['found']:
                 source = _entity['_source']
                 source['id'] = _entity['_id']
+                source['_index'] = _entity['_index']
+                self._set_routing(
+                    source, _entity, routing.get(_entity['_id']) if isinstance(routing, dict) else routing)
                 entity = _type(source, scope)
                 self._persist(entity, state=UPDATE)
                 entities.append(entity)
+        self._defer(entities, _type, scope)
         return entities
 
-    def query(self, query, _type, scope=None, **kwargs):
+    def query(self, query, _type, scope=None, routing=None, cache=True, primary=None, **kwargs):
+        """ Searches entities of given type
+            :param routing: shard routing key, for types with declared routing field query is also
+                filtered to documents with this key
+            :param cache: use query cache of this manager, when it has one
+            :param primary: True reads from write client, False from read client even when reads are pinned
+        """
         params = {}
+        if routing is not None:
+            params['routing'] = routing
+            if _type.get_routing_field():
+                query = dict(query, query={'filtered': {
+                    'query': query.get('query', {'match_all': {}}),
+                    'filter': {'term': {_type.get_routing_field(): routing}}
+                }})
         if scope:
             params['_source'] = _type.get_fields(scope)
         params.update(kwargs)
-        try:
-            data = self.es.search(index=self._index, doc_type=_type.get_type(), body=query, **params)
-        except TransportError as e:
-            raise RepositoryError('Transport returned error', cause=e)
+        index = _type.get_index(self._index)
+        key = data = None
+        if cache and self._query_cache is not None:
+            key = self._query_cache.make_key(_type.get_type(), index, query, scope, params)
+            data = self._query_cache.get(key)
+        if data is None:
+            try:
+                data = self.get_read_client(primary, _type).search(
+                    index=index, doc_type=_type.get_type(), body=query, **params)
+            except TransportError as e:
+                raise RepositoryError('Transport returned error', cause=e)
+            if key is not None and self._query_cache.is_cacheable(_type.get_type()):
+                self._query_cache.set(key, data)
         entities = []
         for record in data['hits']['hits']:
             source = record['_source']
             source['id'] = record['_id']
+            source['_index'] = record['_index']
+            self._set_routing(source, record, routing)
             source['_score'] = record['_score']
+            if 'sort' in record:
+                source['_sort'] = record['sort']
             if '_explanation' in record:
                 source['_explanation'] = record['_explanation']
             entity = _type(source, scope, record.get('highlight'))
             self._persist(entity, state=UPDATE)
             entities.append(entity)
+        self._defer(entities, _type, scope)
         return entities, without(['hits'], data, move_up={'hits': ['max_score', 'total']})
 
+    def query_columns(self, query, _type, scope=None, fields=None, scan=False, record=False, primary=None,
+                      **kwargs):
+        """ Returns dictionary of numpy arrays (or record array) with field values of matching documents
+
+            Entities aren't built nor tracked, so it's meant for analytical exports. Requires numpy.
+            :param fields: fields to fetch, fields of scope by default
+            :param scan: fetch all matching documents with scan and scroll
+        """
+        from .columnar import query_columns
+        client = self.get_read_client(primary, _type)
+        if scan and isinstance(client, ReplicaSet):
+            #  Scroll has to continue on cluster where it started.
+            client = client.pick()
+        return query_columns(client, _type.get_index(self._index), query, _type, scope=scope, fields=fields,
+                             scan=scan, record=record, **kwargs)
+
+    def query_page(self, query, _type, size=20, cursor=None, scope=None, **kwargs):
+        """ Returns page of entities, meta and cursor of next page, which is None after last page
+
+            Next page is filtered to documents sorted after last hit, using _uid as tie-breaker, so deep pages
+            are as cheap as first one. Queries sorted by score can't be filtered and are paged by offset.
+            Sorts by _geo_distance, _script or with missing values placed first raise RepositoryError.
+            :param cursor: opaque cursor returned with previous page
+        """
+        try:
+            sort = normalize_sort(query.get('sort'))
+        except ValueError as e:
+            raise RepositoryError('Unsupported sort', cause=e)
+        body = dict(query, sort=with_tie_breaker(query.get('sort')), size=size)
+        try:
+            position = decode_cursor(cursor) if cursor else {}
+        except ValueError as e:
+            raise RepositoryError('Invalid cursor', cause=e)
+        if is_score_sorted(sort):
+            body['from'] = position.get('o', query.get('from', 0))
+        elif 's' in position:
+            #  Filter replaces offset, which was applied on first page already.
+            body.pop('from', None)
+            body['query'] = {'filtered': {
+                'query': query.get('query', {'match_all': {}}),
+                'filter': after_filter(sort, position['s'])
+            }}
+        entities, meta = self.query(body, _type, scope, **kwargs)
+        next_cursor = None
+        if len(entities) == size:
+            if is_score_sorted(sort):
+                next_cursor = encode_cursor({'o': body['from'] + size})
+            else:
+                next_cursor = encode_cursor({'s': entities[-1]['_sort']})
+        return entities, meta, next_cursor
+
     def query_one(self, query, _type, scope=None, **kwargs):
         entities, meta = self.query(query, _type, scope, **kwargs)
         if len(entities) == 1:
@@ -277,6 +681,9 @@ class EntityManager(object):
 
     def clear(self):
         self._registry = {}
+        self._pending = set()
+        self._watched = set()
+        self._operations = []
 
     def get_repository(self, repository):
         app, repository_class_name = repository.split(':')
@@ -302,11 +709,117 @@ class EntityManager(object):
     def get_client(self):
         return self.es
 
+    def get_read_client(self, primary=None, _type=None):
+        """ Returns client used for reads
+            :param primary: True returns write client, False read client, by default read client is returned
+                unless reads are pinned to write client after recent flush
+            :param _type: Type class which is read, without it reads are pinned after write of any type
+        """
+        if self._read_es is None or primary:
+            return self.es
+        if primary is None and self._read_pin is not None and \
+                self._read_pin.is_pinned((self._index, _type.get_type()) if _type is not None else None):
+            return self.es
+        return self._read_es
+
     def _persist(self, entity, state):
         if id(entity) in self._registry:
-            self._registry[id(entity)].state = state
+            persisted_entity = self._registry[id(entity)]
+            if state == REMOVE and persisted_entity.state == ADD and 'id' not in entity:
+                self._forget(persisted_entity)
+                return
+            persisted_entity.state = state
+        else:
+            persisted_entity = PersistedEntity(entity, state=state, index=self._index,
+                                               on_change=self._mark_pending)
+            self._registry[id(entity)] = persisted_entity
+        if state != UPDATE:
+            self._pending.add(persisted_entity)
+        self._track(persisted_entity)
+
+    def _mark_pending(self, persisted_entity):
+        if self._registry.get(id(persisted_entity._entity)) is persisted_entity:
+            self._pending.add(persisted_entity)
+
+    def _track(self, persisted_entity):
+        """ Entities with nested values are checked on every flush, as they may change in place """
+        if persisted_entity.state == UPDATE and persisted_entity.has_nested_values():
+            self._watched.add(persisted_entity)
+        else:
+            self._watched.discard(persisted_entity)
+
+    def _forget(self, persisted_entity):
+        del self._registry[id(persisted_entity._entity)]
+        self._pending.discard(persisted_entity)
+        self._watched.discard(persisted_entity)
+        persisted_entity._entity._persisted_entity = None
+
+    def _defer(self, entities, _type, scope):
+        if entities and _type.get_fields(scope):
+            DeferredLoader(self, _type, entities)
+
+    @staticmethod
+    def _set_routing(source, hit, routing=None):
+        routing = hit.get('_routing', routing)
+        if routing is not None:
+            source['_routing'] = routing
+
+    def _find_by_search(self, _ids, _type, scope=None, **kwargs):
+        """ Finds entities stored in many indices, for which get and mget can't be used """
+        query = {'query': {'ids': {'values': _ids}}, 'size': len(_ids)}
+        entities, meta = self.query(query, _type, scope, **kwargs)
+        positions = dict((_id, position) for position, _id in enumerate(_ids))
+        return sorted(entities, key=lambda entity: positions[entity['id']])
+
+    @staticmethod
+    def _check_bulk_results(actions, bulk_results):
+        """ Raises BulkIndexError for failed items, except creates with derived id of already existing documents,
+            which are repeated creates of the same content
+        """
+        errors = []
+        for position, (ok, item) in enumerate(bulk_results):
+            if ok:
+                continue
+            if position < len(actions) and actions[position].derived_id and \
+                    item.get('create', {}).get('status') == CONFLICT:
+                continue
+            errors.append(item)
+        if errors:
+            raise BulkIndexError('{num} document(s) failed to index.'.format(num=len(errors)), errors)
+
+    def _coalesce_refresh(self, indices, wait):
+        pending = [self._refresh_coalescer.request(self.es, index) for index in indices]
+        if not wait:
+            return
+        for pending_refresh in pending:
+            try:
+                pending_refresh.wait()
+            except TransportError as e:
+                raise RepositoryError('Index refresh failed', cause=e)
+
+    def _queue_operation(self, operation, entity, field, value, _type, upsert, routing):
+        """ Queue scripted update which will be sent with next flush without fetching document
+            :param entity: entity instance or id of document
+            :param _type: Type class, required when entity is given by id
+            :param routing: shard routing key, taken from entity when not given
+        """
+        parent = None
+        if hasattr(entity, 'to_storage'):
+            if 'id' not in entity:
+                raise RepositoryError('Atomic operations require entity with id')
+            _id, type_name, parent = entity['id'], entity.type, entity.get('_parent', None)
+            index = entity.get('_index', None) or entity.get_storage_index(self._index)
+            if routing is None:
+                routing = entity.get_routing()
         else:
-            self._registry[id(entity)] = PersistedEntity(entity, state=state, index=self._index)
+            if _type is None:
+                raise RepositoryError('Type is required for atomic operations on ids')
+            if _type.is_time_based():
+                raise RepositoryError('Atomic operations on ids are not supported for time based types')
+            _id, type_name, index = entity, _type.get_type(), _type.get_index(self._index)
+        self._operations.append(
+            AtomicUpdate(operation, _id, type_name, field, value, index=index, parent=parent, upsert=upsert,
+                         routing=routing))
 
     def _execute_callbacks(self, actions, type):
         for persisted_entity in actions:
@@ -314,7 +827,8 @@ class EntityManager(object):
                 attr = 'state'
             else:
                 attr = 'last_state'
-            action = {ADD: 'create', UPDATE: 'update', REMOVE: 'delete'}[getattr(persisted_entity, attr)]
+            action_names = {ADD: 'create', UPDATE: 'update', REMOVE: 'delete', MERGE: 'merge'}
+            action = action_names[getattr(persisted_entity, attr)]
             callback_func_name = type + '_' + action
             if hasattr(persisted_entity._entity, callback_func_name):
                 getattr(persisted_entity._entity, callback_func_name)(self)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import six
+from elasticsearch import TransportError
+
+from .type import TypeMeta
+from .manager import group, RepositoryError
+
+
+def get_mapped_types():
+    """ Returns registered types which declare Meta.mapping """
+    return [_type for _type in six.itervalues(TypeMeta.registry) if _type._meta['mapping']]
+
+
+def build_index_body(types):
+    """ Returns index settings and mappings for types stored in one index
+        :param types: iterable of Type classes
+    """
+    settings, mappings, aliases = {}, {}, {}
+    for _type in types:
+        settings.update(_type._meta['index_settings'])
+        mappings[_type.get_type()] = _type.get_mapping()
+        if _type._meta['read_index']:
+            aliases[_type._meta['read_index']] = {}
+    body = {'mappings': mappings}
+    if settings:
+        body['settings'] = settings
+    if aliases:
+        body['aliases'] = aliases
+    return body
+
+
+def build_template(pattern, types, order=0):
+    """ Returns index template applied to every index matching pattern
+        :param pattern: index name pattern, e.g. events-*
+        :param types: iterable of Type classes
+    """
+    body = build_index_body(types)
+    body['template'] = pattern
+    body['order'] = order
+    return body
+
+
+def apply_mappings(client, types=None, default_index='default'):
+    """ Creates indices, templates and mappings for given types
+
+        Time based types get an index template, for other types index is created or their mappings updated.
+        Indices are those written to, Meta.read_index of type becomes alias of newly created indices.
+        :param client: elasticsearch client
+        :param types: iterable of Type classes, all mapped types by default
+        :param default_index: index for types which don't declare own one
+    """
+    types = get_mapped_types() if types is None else types
+    time_based = [_type for _type in types if _type.is_time_based()]
+    patterns = group(time_based, lambda _type: _type.get_write_index_pattern(default_index))
+    for pattern, pattern_types in six.iteritems(patterns):
+        name = 'elasticdata-' + pattern.replace('*', '').strip('-_.')
+        try:
+            client.indices.put_template(name=name, body=build_template(pattern, pattern_types))
+        except TransportError as e:
+            raise RepositoryError('Cannot put template {name}'.format(name=name), cause=e)
+    fixed = [_type for _type in types if not _type.is_time_based()]
+    for index, index_types in six.iteritems(group(fixed, lambda t: t.get_write_index_pattern(default_index))):
+        try:
+            if not client.indices.exists(index=index):
+                client.indices.create(index=index, body=build_index_body(index_types))
+                continue
+            for _type in index_types:
+                client.indices.put_mapping(index=index, doc_type=_type.get_type(), body={
+                    _type.get_type(): _type.get_mapping()
+                })
+        except TransportError as e:
+            raise RepositoryError('Cannot put mappings to index {index}'.format(index=index), cause=e)
+
+
+def compare_properties(declared, live, path=''):
+    """ Returns list of differences between declared and live mapping properties
+
+        Only attributes given in declaration are compared, fields missing in declaration are reported
+        with declared value None.
+        :return: list of tuples (field, declared, live)
+    """
+    drift = []
+    for field, definition in six.iteritems(declared):
+        name = path + field
+        live_definition = live.get(field)
+        if live_definition is None:
+            drift.append((name, definition, None))
+            continue
+        for key, value in six.iteritems(definition):
+            if key == 'properties':
+                drift.extend(compare_properties(value, live_definition.get('properties', {}), name + '.'))
+            elif live_definition.get(key, _default(key)) != value:
+                drift.append((name, definition, live_definition))
+                break
+    for field in set(live.keys()) - set(declared.keys()):
+        drift.append((path + field, None, live[field]))
+    return drift
+
+
+def get_mapping_drift(client, types=None, default_index='default'):
+    """ Compares declared mappings with live ones
+        :return: list of tuples (index, type, field, declared, live)
+    """
+    types = get_mapped_types() if types is None else types
+    drift = []
+    for _type in types:
+        try:
+            live = client.indices.get_mapping(index=_type.get_index(default_index), doc_type=_type.get_type())
+        except TransportError as e:
+            raise RepositoryError('Cannot get mapping of {type}'.format(type=_type.get_type()), cause=e)
+        declared = _type.get_mapping()['properties']
+        if not live:
+            drift.extend((None, _type.get_type(), field, definition, None)
+                         for field, definition in six.iteritems(declared))
+        for index, data in six.iteritems(live):
+            properties = data['mappings'].get(_type.get_type(), {}).get('properties', {})
+            drift.extend((index, _type.get_type()) + difference
+                         for difference in compare_properties(declared, properties))
+    return drift
+
+
+def _default(key):
+    """ Values which elasticsearch omits from returned mapping """
+    return {'type': 'object', 'index': 'analyzed'}.get(key)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+
+
+class Metrics(object):
+    """ Receiver of metrics reported by elasticdata, ignores them
+
+        Subclass it to forward metrics to statsd or other monitoring system.
+    """
+    def gauge(self, name, value):
+        pass
+
+    def timing(self, name, seconds):
+        pass
+
+    def increment(self, name, value=1):
+        pass
+
+
+class MemoryMetrics(Metrics):
+    """ Keeps last gauges, all timings and counters in memory """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.gauges = {}
+        self.timings = {}
+        self.counters = {}
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def timing(self, name, seconds):
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+null_metrics = Metrics()
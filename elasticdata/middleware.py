@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+from .context import open_scope, close_scope
+
+
+class EntityManagerMiddleware(object):
+    """ Provides request.entity_manager, cleared at the end of request
+
+        When ELASTICDATA_FLUSH_ON_RESPONSE is set, manager is flushed for responses without server error.
+    """
+    def process_request(self, request):
+        request.entity_manager = open_scope()
+
+    def process_exception(self, request, exception):
+        em = getattr(request, 'entity_manager', None)
+        if em is not None:
+            close_scope(em)
+
+    def process_response(self, request, response):
+        em = getattr(request, 'entity_manager', None)
+        if em is not None:
+            flush = getattr(settings, 'ELASTICDATA_FLUSH_ON_RESPONSE', False) and response.status_code < 500
+            close_scope(em, flush=flush)
+        return response
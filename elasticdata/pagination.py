@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import base64
+import binascii
+import six
+
+TIE_BREAKER = '_uid'
+UNSUPPORTED = ('_geo_distance', '_script')
+
+
+def normalize_sort(sort):
+    """ Returns sort definition as list of (field, order) tuples ending with _uid tie-breaker
+
+        Sorts which can't be continued by filter (_geo_distance, _script and missing values placed other than
+        last) raise ValueError.
+        :param sort: sort in any form accepted by elasticsearch, None means sorting by score
+    """
+    normalized = []
+    for item in _as_list(sort):
+        if isinstance(item, six.string_types):
+            normalized.append((item, 'desc' if item == '_score' else 'asc'))
+            continue
+        field, order = list(item.items())[0]
+        if field in UNSUPPORTED:
+            raise ValueError('Sort by {field} is not supported by cursors'.format(field=field))
+        if isinstance(order, dict):
+            if order.get('missing', '_last') != '_last':
+                raise ValueError('Missing values of {field} have to be sorted last'.format(field=field))
+            order = order.get('order', 'asc')
+        normalized.append((field, order))
+    if TIE_BREAKER not in [field for field, order in normalized]:
+        normalized.append((TIE_BREAKER, 'asc'))
+    return normalized
+
+
+def with_tie_breaker(sort):
+    """ Returns sort with all options of its entries kept and _uid tie-breaker appended """
+    sort = _as_list(sort)
+    fields = [item if isinstance(item, six.string_types) else list(item.keys())[0] for item in sort]
+    if TIE_BREAKER not in fields:
+        sort.append({TIE_BREAKER: 'asc'})
+    return sort
+
+
+def is_score_sorted(sort):
+    return '_score' in [field for field, order in sort]
+
+
+def after_filter(sort, values):
+    """ Returns filter matching documents placed after document with given sort values
+
+        Documents without sorted field are placed last, which is default of elasticsearch, and their sort
+        value is None.
+    """
+    alternatives = []
+    for position, (field, order) in enumerate(sort):
+        value = values[position]
+        if value is None:
+            #  Only documents missing the field too can follow, they are matched on next positions.
+            continue
+        must = [_equal_filter(f, v) for (f, o), v in zip(sort[:position], values[:position])]
+        after = {'range': {field: {'gt' if order == 'asc' else 'lt': value}}}
+        if field != TIE_BREAKER:
+            after = {'bool': {'should': [after, {'missing': {'field': field}}]}}
+        must.append(after)
+        alternatives.append({'bool': {'must': must}})
+    return {'bool': {'should': alternatives}}
+
+
+def _as_list(sort):
+    if sort is None:
+        return ['_score']
+    if not isinstance(sort, list):
+        return [sort]
+    return list(sort)
+
+
+def _equal_filter(field, value):
+    if value is None:
+        return {'missing': {'field': field}}
+    return {'term': {field: value}}
+
+
+def encode_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError('Invalid cursor {cursor}: {error}'.format(cursor=cursor, error=e))
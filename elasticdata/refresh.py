@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import threading
+
+COALESCE, WAIT = 'coalesce', 'wait'
+
+
+class PendingRefresh(object):
+    def __init__(self):
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self):
+        """ Blocks until refresh is done, re-raises error if refresh failed """
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def _finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+
+class RefreshCoalescer(object):
+    """ Coalesces index refresh requests made within time window into one refresh per index of cluster.
+
+        Refresh is started after window elapses from first request, so it covers writes of every
+        request joined before that moment.
+        :param window: time in seconds for which requests are collected
+    """
+    def __init__(self, window=0.05):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def request(self, client, index):
+        #  Clients of different clusters may use the same index name.
+        key = (id(client), index)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            pending = self._pending[key] = PendingRefresh()
+        thread = threading.Thread(target=self._refresh, args=(client, index, pending))
+        thread.daemon = True
+        thread.start()
+        return pending
+
+    def _refresh(self, client, index, pending):
+        time.sleep(self.window)
+        with self._lock:
+            del self._pending[(id(client), index)]
+        try:
+            client.indices.refresh(index=index)
+        except Exception as e:  # waiters must be released whatever happened
+            pending._finish(e)
+        else:
+            pending._finish()
+
+
+default_coalescer = RefreshCoalescer()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import json
+import threading
+from six.moves import queue
+from elasticsearch import helpers, TransportError, NotFoundError
+
+from .manager import RepositoryError
+
+
+class Checkpoint(object):
+    """ Stores slices which were completely reindexed, so interrupted reindex can be resumed
+
+        Scan order isn't stable, so resumed reindex starts unfinished slices from the beginning,
+        which is safe because documents are written with index operation under their own ids.
+        :param path: path of json file with checkpoint
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {'completed': [], 'count': 0}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._data = json.load(f)
+
+    @property
+    def completed(self):
+        return set(self._data['completed'])
+
+    @property
+    def count(self):
+        return self._data['count']
+
+    def mark(self, _slice, count):
+        with self._lock:
+            self._data['completed'].append(_slice)
+            self._data['count'] += count
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._data, f)
+            os.rename(tmp_path, self.path)
+
+
+def hit_to_action(hit, index, types=None, transform=None):
+    """ Converts scanned hit to bulk index action, returns None when transform skips document
+        :param types: dictionary of doc type name to Type class, source is passed through its to_storage
+        :param transform: callable receiving and returning action
+    """
+    source = hit['_source']
+    if types and hit['_type'] in types:
+        source = types[hit['_type']](source).to_storage()
+    action = {
+        '_op_type': 'index',
+        '_index': index,
+        '_type': hit['_type'],
+        '_id': hit['_id'],
+        '_source': source
+    }
+    for key in ('_routing', '_parent'):
+        if key in hit.get('fields', {}):
+            action[key] = hit['fields'][key]
+    if transform is not None:
+        action = transform(action)
+    return action
+
+
+def get_slices(client, index):
+    """ Returns list of slices of index - one for every primary shard number
+
+        Slice N reads shard N of every index covered by alias or pattern, so there are as many
+        slices as shards of the biggest index.
+    """
+    try:
+        settings = client.indices.get_settings(index=index)
+    except TransportError as e:
+        raise RepositoryError('Cannot get settings of {index}'.format(index=index), cause=e)
+    shards = max([int(data['settings']['index']['number_of_shards']) for data in settings.values()] or [0])
+    return list(range(shards))
+
+
+def swap_alias(client, alias, index):
+    """ Atomically points alias to index, removing it from all other indices """
+    try:
+        current = client.indices.get_alias(name=alias)
+    except NotFoundError:
+        current = {}
+    actions = [{'remove': {'index': old, 'alias': alias}} for old in current if old != index]
+    actions.append({'add': {'index': index, 'alias': alias}})
+    try:
+        client.indices.update_aliases(body={'actions': actions})
+    except TransportError as e:
+        raise RepositoryError('Cannot swap alias {alias}'.format(alias=alias), cause=e)
+
+
+def reindex(client, source_index, target_index, query=None, types=None, transform=None, slices=None,
+            threads=None, chunk_size=500, scroll='5m', checkpoint=None, alias=None, target_client=None):
+    """ Copies documents from source index to target index
+
+        Source is scanned in parallel, one slice per primary shard, and every slice streams its hits into
+        bulk requests of chunk_size documents, so memory used doesn't depend on size of index.
+        :param query: query limiting reindexed documents
+        :param types: dictionary of doc type name to Type class used to rewrite documents
+        :param transform: callable receiving and returning bulk action, returned None skips document
+        :param slices: shard numbers to scan, all primary shards by default
+        :param threads: number of parallel slices, number of slices by default
+        :param checkpoint: Checkpoint instance or path of checkpoint file
+        :param alias: alias switched to target index when every document was reindexed
+        :param target_client: client for target cluster, same as source by default
+        :return: tuple with number of reindexed documents and list of errors
+    """
+    target_client = target_client or client
+    if checkpoint is not None and not isinstance(checkpoint, Checkpoint):
+        checkpoint = Checkpoint(checkpoint)
+    if slices is None:
+        slices = get_slices(client, source_index)
+    pending = queue.Queue()
+    for _slice in slices:
+        if checkpoint is None or _slice not in checkpoint.completed:
+            pending.put(_slice)
+    results = {'count': checkpoint.count if checkpoint else 0, 'errors': [], 'exceptions': []}
+    lock = threading.Lock()
+
+    def actions(_slice):
+        hits = helpers.scan(client, query=query, scroll=scroll, index=source_index,
+                            preference='_shards:{slice}'.format(slice=_slice), fields='_source,_routing,_parent')
+        for hit in hits:
+            action = hit_to_action(hit, target_index, types, transform)
+            if action is not None:
+                yield action
+
+    def worker():
+        while True:
+            try:
+                _slice = pending.get_nowait()
+            except queue.Empty:
+                return
+            count, errors = 0, []
+            try:
+                for ok, item in helpers.streaming_bulk(target_client, actions(_slice), chunk_size=chunk_size,
+                                                       raise_on_error=False):
+                    if ok:
+                        count += 1
+                    else:
+                        errors.append(item)
+            except Exception as e:
+                with lock:
+                    results['exceptions'].append(e)
+                return
+            with lock:
+                results['count'] += count
+                results['errors'].extend(errors)
+            if checkpoint is not None and not errors:
+                checkpoint.mark(_slice, count)
+
+    workers = [threading.Thread(target=worker) for _ in range(min(threads or len(slices), len(slices)))]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if results['exceptions']:
+        raise RepositoryError('Reindex failed', cause=results['exceptions'][0])
+    if alias is not None:
+        if results['errors']:
+            raise RepositoryError('Reindex finished with {num} errors, alias {alias} not switched'.format(
+                num=len(results['errors']), alias=alias))
+        swap_alias(target_client, alias, target_index)
+    return results['count'], results['errors']
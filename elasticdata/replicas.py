@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import logging
+import threading
+from elasticsearch import Elasticsearch, TransportError, ConnectionError
+
+from .metrics import null_metrics
+from .compression import get_client_settings
+
+logger = logging.getLogger('elasticdata.replicas')
+
+UNAVAILABLE = (502, 503, 504)
+
+
+class ReplicaSet(object):
+    """ Read only clients of replica clusters used in round robin order
+
+        Client failing with connection error or unavailable status is skipped for retry_after seconds and
+        request is repeated on next one. When all clients are failing, the least recently failed is tried.
+        Set behaves like client for single requests, use pick to get one client for scrolls.
+        :param clients: Elasticsearch clients or their settings
+        :param retry_after: how long failed client is skipped, in seconds
+        :param metrics: Metrics instance
+    """
+    def __init__(self, clients, retry_after=30.0, metrics=None):
+        self.clients = [client if not isinstance(client, dict) else Elasticsearch(**get_client_settings(client))
+                        for client in clients]
+        if not self.clients:
+            raise ValueError('Replica set requires at least one client')
+        self.retry_after = retry_after
+        self.metrics = metrics or null_metrics
+        self._failed = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def pick(self):
+        """ Returns next healthy client """
+        return self._candidates()[0]
+
+    def mark_failed(self, client):
+        with self._lock:
+            self._failed[id(client)] = time.time()
+        self.metrics.increment('elasticdata.replicas.failed')
+
+    def mark_healthy(self, client):
+        with self._lock:
+            self._failed.pop(id(client), None)
+
+    def is_healthy(self, client):
+        failed_at = self._failed.get(id(client))
+        return failed_at is None or time.time() - failed_at >= self.retry_after
+
+    def perform(self, method, *args, **kwargs):
+        """ Calls method of healthy client, fails over to next ones when cluster is unavailable """
+        error = None
+        for client in self._candidates():
+            try:
+                result = getattr(client, method)(*args, **kwargs)
+            except TransportError as e:
+                if not isinstance(e, ConnectionError) and e.status_code not in UNAVAILABLE:
+                    raise
+                logger.warning('Replica %r is unavailable: %s', client, e)
+                self.mark_failed(client)
+                error = e
+            else:
+                self.mark_healthy(client)
+                return result
+        raise error
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            return self.perform(method, *args, **kwargs)
+        return call
+
+    def _candidates(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.clients)
+        ordered = self.clients[start:] + self.clients[:start]
+        healthy = [client for client in ordered if self.is_healthy(client)]
+        if healthy:
+            return healthy
+        return sorted(ordered, key=lambda client: self._failed.get(id(client), 0))[:1]
+
+
+class ReadPin(object):
+    """ Remembers recent writes, so reads of written types go to primary cluster until replicas catch up
+
+        Keys are (index of manager, type name) pairs. Share one instance between managers (scoped managers
+        do) to keep reads consistent across requests served by this process.
+        :param duration: for how many seconds reads are pinned after write
+    """
+    def __init__(self, duration):
+        self.duration = duration
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def pin(self, keys):
+        until = time.time() + self.duration
+        with self._lock:
+            for key in keys:
+                self._until[key] = until
+
+    def is_pinned(self, key=None):
+        """ Returns True when key, or any key when not given, was written recently """
+        now = time.time()
+        with self._lock:
+            if key is None:
+                return any(until > now for until in self._until.values())
+            return self._until.get(key, 0) > now
+
+
+def create_read_client(read_es_settings):
+    """ Returns client for settings dictionary or ReplicaSet for list of settings """
+    if isinstance(read_es_settings, dict):
+        return Elasticsearch(**get_client_settings(read_es_settings))
+    return ReplicaSet(read_es_settings)
@@ -1,22 +1,53 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
 
+import re
 import copy
+import json
+import hashlib
 from collections import MutableMapping
 from abc import ABCMeta
-from six import add_metaclass
+from datetime import datetime
+from six import add_metaclass, string_types, text_type
 from inflection import underscore
 
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+CONTENT = '*'
+
 
 class ValidationError(Exception):
     pass
 
 
+def parse_date(value):
+    """ Parses date stored in elasticsearch, returns None for unknown format
+        :param value: datetime or string in one of DATE_FORMATS (fractions and timezone are ignored)
+    """
+    if not isinstance(value, string_types):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:19], date_format)
+        except ValueError:
+            pass
+    return None
+
+
 class TypeMeta(ABCMeta):
+    registry = {}
+
     def __new__(mcs, name, bases, attrs):
         meta = {
             'scopes': dict(),
             'timestamps': False,
+            'index': None,
+            'index_date_field': None,
+            'read_index': None,
+            'routing': None,
+            'key_fields': None,
+            'mapping': dict(),
+            'mapping_options': dict(),
+            'index_settings': dict(),
         }
         for base in bases:
             if hasattr(base, '_meta'):
@@ -28,8 +59,17 @@ class TypeMeta(ABCMeta):
                 meta['scopes'].update(attrs['Meta'].scopes)
             if hasattr(attrs['Meta'], 'timestamps'):
                 meta['timestamps'] = attrs['Meta'].timestamps
+            for key in ('index', 'index_date_field', 'read_index', 'routing', 'key_fields'):
+                if hasattr(attrs['Meta'], key):
+                    meta[key] = getattr(attrs['Meta'], key)
+            for key in ('mapping', 'mapping_options', 'index_settings'):
+                if hasattr(attrs['Meta'], key):
+                    meta[key] = dict(meta[key])
+                    meta[key].update(getattr(attrs['Meta'], key))
         attrs['_meta'] = copy.deepcopy(meta)
-        return super(TypeMeta, mcs).__new__(mcs, name, bases, attrs)
+        cls = super(TypeMeta, mcs).__new__(mcs, name, bases, attrs)
+        mcs.registry[cls.get_type()] = cls
+        return cls
 
 
 @add_metaclass(TypeMeta)
@@ -39,6 +79,7 @@ class Type(MutableMapping):
         self._errors = {}
         self._scope = scope
         self._highlight = highlight
+        self._deferred = None
 
     def to_storage(self, *args, **kwargs):
         keys = self._get_keys()
@@ -120,14 +161,104 @@ class Type(MutableMapping):
     def get_type(cls):
         return underscore(cls.__name__).lower()
 
+    @classmethod
+    def get_index(cls, default=None):
+        """ Returns index, alias or index pattern used for reading documents of this type
+            :param default: index used when type doesn't declare own one
+        """
+        if cls._meta['read_index']:
+            return cls._meta['read_index']
+        return cls.get_write_index_pattern(default)
+
+    @classmethod
+    def get_write_index_pattern(cls, default=None):
+        """ Returns index, or pattern of indices for time based types, to which documents are written
+            :param default: index used when type doesn't declare own one
+        """
+        if cls._meta['index'] is None:
+            return default
+        if cls.is_time_based():
+            return re.sub(r'%[a-zA-Z]', '*', cls._meta['index'])
+        return cls._meta['index']
+
+    @classmethod
+    def is_time_based(cls):
+        return cls._meta['index'] is not None and cls._meta['index_date_field'] is not None
+
+    @classmethod
+    def get_mapping(cls):
+        """ Returns mapping of this type built from Meta.mapping and Meta.mapping_options """
+        mapping = copy.deepcopy(cls._meta['mapping_options'])
+        properties = copy.deepcopy(cls._meta['mapping'])
+        if cls._meta['timestamps']:
+            for field in ('created_at', 'updated_at'):
+                properties.setdefault(field, {'type': 'date'})
+        if cls._meta['routing']:
+            mapping.setdefault('_routing', {'required': True})
+        mapping['properties'] = properties
+        return mapping
+
+    @classmethod
+    def get_routing_field(cls):
+        return cls._meta['routing']
+
+    def get_routing(self):
+        """ Returns shard routing key from declared routing field or routing the entity was loaded with """
+        field = self._meta['routing']
+        if field is None:
+            return None
+        value = self._data.get(field, None)
+        if value is None:
+            value = self._data.get('_routing', None)
+        return value if value is None else text_type(value)
+
+    def get_key_id(self):
+        """ Returns id derived from values of Meta.key_fields, or from whole content when key_fields is CONTENT
+
+            Same values always give the same id, so created document can be safely sent again.
+            Timestamps aren't part of content. Returns None for types without key_fields.
+        """
+        key_fields = self._meta['key_fields']
+        if key_fields is None:
+            return None
+        storage = self.to_storage()
+        if key_fields == CONTENT:
+            values = [[key, storage[key]] for key in sorted(storage)
+                      if key not in ('id', 'created_at', 'updated_at')]
+        else:
+            values = [[field, storage.get(field, self._data.get(field, None))] for field in key_fields]
+            missing = [field for field, value in values if value is None]
+            if missing:
+                raise ValidationError('Key fields {fields} have no value'.format(fields=', '.join(missing)))
+        key = json.dumps(values, sort_keys=True, separators=(',', ':'), default=_serialize_key_value)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get_storage_index(self, default=None):
+        """ Returns concrete index to which this entity should be written
+            :param default: index used when type doesn't declare own one
+        """
+        if self._meta['index'] is None:
+            return default
+        if self.is_time_based():
+            date = parse_date(self._data.get(self._meta['index_date_field'], None)) or datetime.now()
+            return date.strftime(self._meta['index'])
+        return self._meta['index']
+
     def __getitem__(self, item):
+        if item not in self._data and self._deferred is not None and self._is_deferrable(item):
+            self._deferred.load()
         return self._data[item]
 
+    def __contains__(self, item):
+        return item in self._data
+
     def __setitem__(self, item, value):
         self._data[item] = value
+        self._changed()
 
     def __delitem__(self, item):
         del self._data[item]
+        self._changed()
 
     def __iter__(self):
         return iter(self._data)
@@ -135,12 +266,27 @@ class Type(MutableMapping):
     def __len__(self):
         return len(self._data)
 
+    @staticmethod
+    def _is_deferrable(item):
+        return isinstance(item, string_types) and not item.startswith('_') and item != 'id'
+
+    def _changed(self):
+        persisted_entity = getattr(self, '_persisted_entity', None)
+        if persisted_entity:
+            persisted_entity.mark_dirty()
+
     def _get_keys(self):
         if self._scope and self._scope in self._meta['scopes']:
             return self._meta['scopes'][self._scope]
         return [key for key in self._data.keys() if not key.startswith('_')]
 
 
+def _serialize_key_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return text_type(value)
+
+
 class TimestampedType(Type):
     class Meta:
         timestamps = True
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from elasticsearch import helpers
+
+from .manager import RepositoryError, CONFLICT
+from .metrics import null_metrics
+
+logger = logging.getLogger('elasticdata.writebehind')
+
+
+class WriteBehindQueue(object):
+    """ Bounded queue of serialized bulk statements sent to elasticsearch by background thread
+
+        Statements from many flushes are batched together. When queue is full, put blocks until there is
+        space (or timeout elapses). Queue is drained when stopped, which also happens on interpreter exit.
+        :param max_size: maximal number of queued statements
+        :param batch_size: maximal number of statements in one bulk request
+        :param flush_interval: how long worker waits for batch to fill up, in seconds
+        :param on_error: callable receiving list of failed items or exception raised by bulk request
+        :param metrics: Metrics instance
+    """
+    def __init__(self, client, max_size=10000, batch_size=500, flush_interval=1.0, on_error=None, metrics=None):
+        self.client = client
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.metrics = metrics or null_metrics
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        atexit.register(self.stop)
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """ Sends all queued statements and stops worker """
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def put(self, stmts, timeout=None, ignore_conflicts=()):
+        """ Serializes statements and queues them, blocking while queue is full
+            :param timeout: maximal time of waiting for space in seconds, RepositoryError is raised after it
+            :param ignore_conflicts: positions of creates for which existing document isn't failure,
+                e.g. creates with ids derived from content
+        """
+        serialized = []
+        for position, stmt in enumerate(stmts):
+            action, data = helpers.expand_action(stmt)
+            lines = [self.client.transport.serializer.dumps(action)] + \
+                ([self.client.transport.serializer.dumps(data)] if data is not None else [])
+            serialized.append((lines, position in ignore_conflicts))
+        if self._thread is None:
+            self.start()
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            #  Batch bigger than whole queue is accepted when queue is empty.
+            while self._buffer and len(self._buffer) + len(serialized) > self.max_size:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self.metrics.increment('elasticdata.write_behind.full')
+                    raise RepositoryError('Write behind queue is full')
+                self._condition.wait(remaining)
+            self._buffer.extend(serialized)
+            self.metrics.gauge('elasticdata.write_behind.queued', len(self._buffer))
+            self._condition.notify_all()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._buffer and not self._stopping:
+                self._condition.wait()
+            deadline = time.time() + self.flush_interval
+            while len(self._buffer) < self.batch_size and not self._stopping and time.time() < deadline:
+                self._condition.wait(deadline - time.time())
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            self.metrics.gauge('elasticdata.write_behind.queued', len(self._buffer))
+            self._condition.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._send(batch)
+
+    def _send(self, batch):
+        body = '\n'.join(line for lines, ignore_conflict in batch for line in lines) + '\n'
+        started = time.time()
+        try:
+            resp = self.client.bulk(body)
+        except Exception as e:  # worker has to survive any failure
+            logger.exception('Write behind bulk request failed')
+            self.metrics.increment('elasticdata.write_behind.failed', len(batch))
+            self._report(e)
+            return
+        self.metrics.timing('elasticdata.write_behind.latency', time.time() - started)
+        errors = [item for item, (lines, ignore_conflict) in zip(resp['items'], batch)
+                  if not self._is_success(item, ignore_conflict)]
+        self.metrics.increment('elasticdata.write_behind.sent', len(batch) - len(errors))
+        if errors:
+            self.metrics.increment('elasticdata.write_behind.failed', len(errors))
+            self._report(errors)
+
+    @staticmethod
+    def _is_success(item, ignore_conflict):
+        status = list(item.values())[0].get('status', 500)
+        if ignore_conflict and status == CONFLICT and 'create' in item:
+            return True
+        return 200 <= status < 300
+
+    def _report(self, error):
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(error)
+        except Exception:
+            logger.exception('Write behind error callback failed')
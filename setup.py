@@ -11,13 +11,14 @@ setup(
     author_email='me@karolsikora.me',
     description='A high level framework to manage data stored in elasticsearch.',
     license='BSD',
-    packages=['elasticdata'],
+    packages=['elasticdata', 'elasticdata.management', 'elasticdata.management.commands'],
     install_requires=[
         'Django>=1.6.7,<1.7',
         'elasticsearch>=1.0.0,<2.0.0',
         'six',
         'inflection'
     ],
+    extras_require={'numpy': ['numpy']},
     test_requires=['mock'],
     classifiers=[
         'Intended Audience :: Developers',
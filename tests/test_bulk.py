@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase
+from mock import Mock
+from elasticsearch import TransportError
+from elasticsearch.helpers import BulkIndexError
+from elasticsearch.serializer import JSONSerializer
+
+from elasticdata.bulk import AdaptiveBulkSender
+from elasticdata.metrics import MemoryMetrics
+
+
+def actions(num):
+    return [{'_op_type': 'index', '_index': 'test', '_type': 't', '_id': str(i), '_source': {'i': i}}
+            for i in range(num)]
+
+
+def fake_client(took=10, statuses=None):
+    """ Client answering bulk with given took, statuses is list of status lists for consecutive requests """
+    client = Mock()
+    client.transport.serializer = JSONSerializer()
+    statuses = list(statuses or [])
+    client.chunks = []
+
+    def bulk(body, **kwargs):
+        lines = body.strip().split('\n')
+        items = [JSONSerializer().loads(line) for line in lines[::2]]
+        client.chunks.append(len(items))
+        chunk_statuses = statuses.pop(0) if statuses else [201] * len(items)
+        return {'took': took, 'items': [
+            {'index': {'_id': item['index']['_id'], 'status': status}}
+            for item, status in zip(items, chunk_statuses)
+        ]}
+    client.bulk.side_effect = bulk
+    return client
+
+
+class AdaptiveBulkSenderTestCase(TestCase):
+    def test_grow(self):
+        metrics = MemoryMetrics()
+        sender = AdaptiveBulkSender(chunk_size=10, max_chunk_size=20, metrics=metrics)
+        client = fake_client(took=10)
+        results = list(sender.send(client, actions(100)))
+        self.assertEqual([item['index']['_id'] for ok, item in results], [str(i) for i in range(100)])
+        self.assertTrue(all(ok for ok, item in results))
+        self.assertEqual(client.chunks[:3], [10, 12, 15])
+        self.assertEqual(sender.chunk_size, 20)
+        self.assertEqual(metrics.gauges['elasticdata.bulk.chunk_size'], 20)
+        self.assertEqual(metrics.counters['elasticdata.bulk.items'], 100)
+
+    def test_shrink_on_slow_bulk(self):
+        sender = AdaptiveBulkSender(chunk_size=100, min_chunk_size=50, target_time=0.5)
+        list(sender.send(fake_client(took=1000), actions(300)))
+        self.assertEqual(sender.chunk_size, 50)
+
+    def test_retry_rejected(self):
+        metrics = MemoryMetrics()
+        sender = AdaptiveBulkSender(chunk_size=4, backoff=0, metrics=metrics)
+        client = fake_client(statuses=[[201, 429, 201, 429], [201, 429], [201]])
+        results = list(sender.send(client, actions(4)))
+        self.assertTrue(all(ok for ok, item in results))
+        self.assertEqual([item['index']['_id'] for ok, item in results], ['0', '1', '2', '3'])
+        self.assertEqual(client.chunks, [4, 2, 1])
+        self.assertEqual(sender.chunk_size, 10)
+        self.assertEqual(metrics.counters['elasticdata.bulk.rejected'], 3)
+
+    def test_errors(self):
+        sender = AdaptiveBulkSender(chunk_size=2, max_retries=0)
+        client = fake_client(statuses=[[201, 429]])
+        self.assertRaises(BulkIndexError, list, sender.send(client, actions(2)))
+        results = list(sender.send(fake_client(statuses=[[201, 400]]), actions(2), raise_on_error=False))
+        self.assertEqual([ok for ok, item in results], [True, False])
+
+    def test_rejected_request(self):
+        sender = AdaptiveBulkSender(chunk_size=100, backoff=0)
+        client = fake_client()
+        bulk = client.bulk.side_effect
+        calls = []
+
+        def rejecting_bulk(body, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise TransportError(429, 'rejected')
+            return bulk(body, **kwargs)
+        client.bulk.side_effect = rejecting_bulk
+        results = list(sender.send(client, actions(3)))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sender.chunk_size, 50)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from unittest import TestCase
+from mock import Mock, patch
+
+from elasticdata import Type, EntityManager
+from elasticdata.cache import LocMemQueryCache
+
+
+class CachedTestType(Type):
+    pass
+
+
+def search_response():
+    return {
+        'took': 1,
+        'hits': {'total': 1, 'max_score': 1.0, 'hits': [
+            {'_index': 'test', '_type': 'cached_test_type', '_id': '1', '_score': 1.0, '_source': {'foo': 'bar'}}
+        ]}
+    }
+
+
+class LocMemQueryCacheTestCase(TestCase):
+    def test_get_set(self):
+        cache = LocMemQueryCache(ttl=60, max_size=2)
+        key = cache.make_key('t', 'index', {'query': {'match_all': {}}, 'size': 1})
+        self.assertEqual(key, cache.make_key('t', 'index', {'size': 1, 'query': {'match_all': {}}}))
+        self.assertNotEqual(key, cache.make_key('t', 'index', {'size': 2, 'query': {'match_all': {}}}))
+        value = {'a': [1]}
+        cache.set(key, value)
+        value['a'].append(2)
+        self.assertEqual(cache.get(key), {'a': [1]})
+        cache.get(key)['a'].append(3)
+        self.assertEqual(cache.get(key), {'a': [1]})
+        cache.set('k2', 2)
+        cache.get(key)
+        cache.set('k3', 3)
+        self.assertIsNone(cache.get('k2'))
+        self.assertIsNotNone(cache.get(key))
+
+    def test_ttl(self):
+        cache = LocMemQueryCache(ttl=0.01)
+        cache.set('k', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('k'))
+
+    def test_invalidate(self):
+        cache = LocMemQueryCache()
+        key = cache.make_key('t', 'index', {})
+        cache.invalidate(['t'])
+        self.assertNotEqual(key, cache.make_key('t', 'index', {}))
+        self.assertEqual(cache.make_key('u', 'index', {}), cache.make_key('u', 'index', {}))
+        self.assertFalse(cache.is_cacheable('t'))
+        self.assertTrue(cache.is_cacheable('u'))
+        cache.invalidate(['u'], delay=0)
+        self.assertTrue(cache.is_cacheable('u'))
+
+
+class ManagerQueryCacheTestCase(TestCase):
+    def test_query_cache(self):
+        client = Mock()
+        client.search.side_effect = lambda **kwargs: search_response()
+        em = EntityManager(index='test', client=client, query_cache=LocMemQueryCache())
+        entities, meta = em.query({'query': {'match_all': {}}}, CachedTestType)
+        entities[0]['foo'] = 'changed'
+        entities2, meta = em.query({'query': {'match_all': {}}}, CachedTestType)
+        self.assertEqual(client.search.call_count, 1)
+        self.assertIsNot(entities[0], entities2[0])
+        self.assertEqual(entities2[0]['foo'], 'bar')
+        em.query({'query': {'match_all': {}}}, CachedTestType, cache=False)
+        self.assertEqual(client.search.call_count, 2)
+        with patch('elasticdata.manager.helpers.streaming_bulk') as streaming_bulk:
+            streaming_bulk.return_value = [(True, {'update': {}})]
+            em.flush()
+        em.query({'query': {'match_all': {}}}, CachedTestType)
+        self.assertEqual(client.search.call_count, 3)
+        em.query({'query': {'match_all': {}}}, CachedTestType)
+        self.assertEqual(client.search.call_count, 4)
+
+    def test_refreshed_flush(self):
+        client = Mock()
+        client.search.side_effect = lambda **kwargs: search_response()
+        em = EntityManager(index='test', client=client, query_cache=LocMemQueryCache(refresh_interval=60))
+        entities, meta = em.query({'query': {'match_all': {}}}, CachedTestType)
+        entities[0]['foo'] = 'changed'
+        with patch('elasticdata.manager.helpers.streaming_bulk') as streaming_bulk:
+            streaming_bulk.return_value = [(True, {'update': {}})]
+            em.flush(refresh=True)
+        em.query({'query': {'match_all': {}}}, CachedTestType)
+        em.query({'query': {'match_all': {}}}, CachedTestType)
+        self.assertEqual(client.search.call_count, 2)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase, skipIf
+from mock import Mock, patch
+
+from elasticdata import Type, EntityManager, RepositoryError
+from elasticdata import columnar
+from elasticdata.columnar import to_array, hits_to_columns
+
+numpy = columnar.numpy
+
+
+class ColumnarTestType(Type):
+    class Meta:
+        scopes = {
+            'report': ('name', 'count', 'price', 'date')
+        }
+        mapping = {
+            'count': {'type': 'integer'},
+            'price': {'type': 'double'},
+            'date': {'type': 'date'}
+        }
+
+
+class DynamicColumnarTestType(Type):
+    def get_name(self, value):
+        return value.upper() if value is not None else None
+
+
+def hit(_id, **source):
+    return {'_index': 'test', '_type': 'columnar_test_type', '_id': _id, '_score': 1.0, '_source': source}
+
+
+@skipIf(numpy is None, 'numpy is not installed')
+class ColumnarTestCase(TestCase):
+    def test_to_array(self):
+        self.assertEqual(to_array([1, 2], 'integer').dtype, numpy.dtype('int64'))
+        self.assertTrue(numpy.isnan(to_array([1, None], 'integer')[1]))
+        self.assertTrue(numpy.isnan(to_array([None], 'double')[0]))
+        dates = to_array(['2014-10-10T10:00:00', None], 'date')
+        self.assertEqual(dates.dtype, numpy.dtype('datetime64[ms]'))
+        self.assertEqual(dates[0], numpy.datetime64('2014-10-10T10:00:00'))
+        self.assertTrue(numpy.isnat(dates[1]))
+        self.assertEqual(to_array([1.5, None]).dtype, numpy.dtype('float64'))
+        self.assertEqual(to_array(['a', None]).dtype, numpy.dtype('object'))
+        self.assertEqual(to_array([True, False], 'boolean').dtype, numpy.dtype('bool'))
+
+    def test_batches(self):
+        hits = [hit(str(i), count=i if i != 3 else None) for i in range(5)]
+        columns = hits_to_columns(hits, ['count'], {'count': 'integer'}, batch_size=2)
+        self.assertEqual(list(columns['id']), ['0', '1', '2', '3', '4'])
+        self.assertEqual(columns['count'].dtype, numpy.dtype('float64'))
+        self.assertEqual(list(columns['count'][:3]), [0, 1, 2])
+        self.assertTrue(numpy.isnan(columns['count'][3]))
+        self.assertEqual(len(hits_to_columns([], ['count'], {'count': 'integer'})['count']), 0)
+
+    def test_query_columns(self):
+        client = Mock()
+        client.search.return_value = {'hits': {'total': 2, 'max_score': 1.0, 'hits': [
+            hit('1', name='a', count=1, price=1.5, date='2014-10-10T10:00:00'),
+            hit('2', name='b', count=2)
+        ]}}
+        em = EntityManager(index='test', client=client)
+        columns = em.query_columns({'query': {'match_all': {}}}, ColumnarTestType, scope='report')
+        client.search.assert_called_once_with(index='test', doc_type='columnar_test_type',
+                                              body={'query': {'match_all': {}}},
+                                              _source=['name', 'count', 'price', 'date'])
+        self.assertEqual(list(columns['name']), ['a', 'b'])
+        self.assertEqual(list(columns['count']), [1, 2])
+        self.assertTrue(numpy.isnan(columns['price'][1]))
+        self.assertTrue(numpy.isnat(columns['date'][1]))
+        self.assertEqual(len(em._registry), 0)
+        records = em.query_columns({}, ColumnarTestType, fields=['count'], record=True)
+        self.assertEqual(list(records.id), ['1', '2'])
+        self.assertEqual(list(records['count']), [1, 2])
+        self.assertRaises(RepositoryError, em.query_columns, {}, ColumnarTestType)
+
+    def test_scan(self):
+        client = Mock()
+        em = EntityManager(index='test', client=client)
+        with patch('elasticdata.columnar.helpers.scan', return_value=iter([hit('1', count=3)])) as scan:
+            columns = em.query_columns({}, ColumnarTestType, fields=['count'], scan=True)
+        scan.assert_called_once_with(client, query={}, index='test', doc_type='columnar_test_type',
+                                     _source=['count'])
+        self.assertEqual(list(columns['count']), [3])
+
+    def test_dynamic_mapping(self):
+        client = Mock()
+        client.search.return_value = {'hits': {'total': 2, 'max_score': 1.0, 'hits': [
+            hit('1', name='a', date='2014-10-10T10:00:00.123Z', code='x1'),
+            hit('2', name=None, date=None, code='2014-10-10')
+        ]}}
+        em = EntityManager(index='test', client=client)
+        columns = em.query_columns({}, DynamicColumnarTestType, fields=['name', 'date', 'code'])
+        self.assertEqual(columns['date'].dtype, numpy.dtype('datetime64[ms]'))
+        self.assertEqual(columns['date'][0], numpy.datetime64('2014-10-10T10:00:00'))
+        self.assertTrue(numpy.isnat(columns['date'][1]))
+        self.assertEqual(columns['code'].dtype, numpy.dtype('object'))
+        self.assertEqual(list(columns['name']), ['A', None])
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import gzip
+import zlib
+import threading
+from io import BytesIO
+from unittest import TestCase
+from six.moves import BaseHTTPServer
+from elasticsearch import Elasticsearch, Urllib3HttpConnection
+
+from elasticdata import get_client
+from elasticdata.compression import get_client_settings, CompressedHttpConnection
+from elasticdata.metrics import MemoryMetrics
+
+
+class CompressingServer(object):
+    """ Local http server echoing decompressed request body, gzipped when client accepts it """
+    def __init__(self):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def handle_request(self):
+                data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                server.requests.append((self.headers.get('Content-Encoding'), len(data)))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    data = gzip.GzipFile(fileobj=BytesIO(data)).read()
+                body = json.dumps({'echo': data.decode('utf-8')}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                    body = zlib.compress(body)
+                    self.send_header('Content-Encoding', 'deflate')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.01, ))
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def hosts(self):
+        return [{'host': '127.0.0.1', 'port': self.httpd.server_address[1]}]
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class CompressionTestCase(TestCase):
+    def setUp(self):
+        self.server = CompressingServer()
+        self.metrics = MemoryMetrics()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_client_settings(self):
+        self.assertEqual(get_client_settings({'hosts': ['a']}), {'hosts': ['a']})
+        self.assertEqual(get_client_settings({'compression': False}), {})
+        self.assertEqual(get_client_settings({'compression': True}),
+                         {'compression': True, 'connection_class': CompressedHttpConnection})
+        self.assertEqual(get_client_settings(None), {})
+        client = get_client({'hosts': self.server.hosts, 'compression': {'threshold': 10}})
+        self.assertIsInstance(client.transport.get_connection(), CompressedHttpConnection)
+        self.assertEqual(client.transport.get_connection().threshold, 10)
+        client = get_client({'hosts': self.server.hosts})
+        self.assertIs(type(client.transport.get_connection()), Urllib3HttpConnection)
+
+    def test_compressed_request(self):
+        client = Elasticsearch(**get_client_settings({
+            'hosts': self.server.hosts, 'compression': {'threshold': 100, 'metrics': self.metrics}}))
+        query = {'query': {'terms': {'tag': ['value'] * 100}}}
+        self.assertEqual(json.loads(client.search(body=query)['echo']), query)
+        encoding, size = self.server.requests[-1]
+        self.assertEqual(encoding, 'gzip')
+        self.assertLess(size, len(json.dumps(query)))
+        self.assertLess(self.metrics.gauges['elasticdata.transport.request_ratio'], 0.5)
+        self.assertIn('elasticdata.transport.compress_time', self.metrics.timings)
+        self.assertIn('elasticdata.transport.response_ratio', self.metrics.gauges)
+        self.assertIn('elasticdata.transport.decompress_time', self.metrics.timings)
+        client.search(body={'size': 1})
+        self.assertIsNone(self.server.requests[-1][0])
+        self.assertEqual(self.metrics.counters['elasticdata.transport.request_bytes'], len(json.dumps(query)))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+from unittest import TestCase
+from mock import Mock, patch
+
+from elasticdata import Type, RepositoryError
+from elasticdata.replicas import ReadPin
+from elasticdata.context import entity_manager_scope, current_entity_manager, open_scope, close_scope
+
+
+class ContextTestType(Type):
+    pass
+
+
+@patch('elasticdata.context.get_shared_client', Mock())
+@patch('elasticdata.context.get_shared_read_client', Mock(return_value=None))
+@patch('elasticdata.context.get_shared_read_pin', Mock(return_value=None))
+class EntityManagerScopeTestCase(TestCase):
+    def test_scope(self):
+        self.assertRaises(RepositoryError, current_entity_manager)
+        with entity_manager_scope(index='test') as em:
+            self.assertIs(current_entity_manager(), em)
+            with entity_manager_scope(index='test') as em2:
+                self.assertIs(current_entity_manager(), em2)
+            self.assertIs(current_entity_manager(), em)
+            em.persist(ContextTestType({'foo': 'bar'}))
+        self.assertEqual(len(em._registry), 0)
+        self.assertRaises(RepositoryError, current_entity_manager)
+
+    def test_flush(self):
+        with patch('elasticdata.manager.EntityManager.flush') as flush:
+            with entity_manager_scope(index='test', flush=True):
+                pass
+            self.assertEqual(flush.call_count, 1)
+            try:
+                with entity_manager_scope(index='test', flush=True):
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertEqual(flush.call_count, 1)
+            em = open_scope(index='test')
+            close_scope(em, flush=True)
+            close_scope(em, flush=True)
+            self.assertEqual(flush.call_count, 2)
+
+    def test_thread_local(self):
+        managers = []
+
+        def worker():
+            with entity_manager_scope(index='test') as em:
+                managers.append(current_entity_manager() is em)
+
+        with entity_manager_scope(index='test') as em:
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+            self.assertIs(current_entity_manager(), em)
+        self.assertEqual(managers, [True])
+
+    def test_read_settings(self):
+        read_client, pin = Mock(), ReadPin(5)
+        get_read_client = Mock(return_value=read_client)
+        with patch('elasticdata.context.get_shared_read_client', get_read_client), \
+                patch('elasticdata.context.get_shared_read_pin', Mock(return_value=pin)):
+            with entity_manager_scope(index='test', read_es_settings=[{'hosts': ['replica']}]) as em:
+                self.assertIs(em.get_read_client(), read_client)
+                self.assertIs(em._read_pin, pin)
+        get_read_client.assert_called_once_with([{'hosts': ['replica']}])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase
+from mock import Mock, patch
+
+from elasticdata import Type, EntityManager
+
+
+class DeferredTestType(Type):
+    class Meta:
+        scopes = {
+            'small': ('foo', 'bar')
+        }
+
+
+def search_response():
+    return {'hits': {'total': 2, 'max_score': 1.0, 'hits': [
+        {'_index': 'test', '_type': 'deferred_test_type', '_id': str(i), '_score': 1.0, '_source': {'foo': i}}
+        for i in range(2)
+    ]}}
+
+
+def mget_response(**kwargs):
+    return {'docs': [
+        {'_index': 'test', '_type': 'deferred_test_type', '_id': doc['_id'], 'found': True,
+         '_source': {'foo': int(doc['_id']), 'baz': 'baz' + doc['_id'], 'tags': ['a']}}
+        for doc in kwargs['body']['docs']
+    ]}
+
+
+class DeferredFieldsTestCase(TestCase):
+    def setUp(self):
+        self.client = Mock()
+        self.client.search.return_value = search_response()
+        self.client.mget.side_effect = mget_response
+        self.em = EntityManager(index='test', client=self.client)
+
+    def test_load(self):
+        entities, meta = self.em.query({'query': {'match_all': {}}}, DeferredTestType, scope='small')
+        self.assertFalse('baz' in entities[0])
+        self.assertIsNone(entities[0].get('_parent'))
+        self.assertEqual(self.client.mget.call_count, 0)
+        self.assertEqual(entities[1]['baz'], 'baz1')
+        self.assertEqual(entities[0]['baz'], 'baz0')
+        self.assertEqual(self.client.mget.call_count, 1)
+        docs = self.client.mget.call_args[1]['body']['docs']
+        self.assertEqual(sorted(doc['_id'] for doc in docs), ['0', '1'])
+        self.assertIsNone(entities[0].scope)
+        self.assertRaises(KeyError, lambda: entities[0]['unknown'])
+        self.assertEqual(self.client.mget.call_count, 1)
+
+    @patch('elasticdata.manager.helpers.streaming_bulk')
+    def test_snapshot(self, streaming_bulk):
+        streaming_bulk.return_value = []
+        entities, meta = self.em.query({'query': {'match_all': {}}}, DeferredTestType, scope='small')
+        entities[0]['foo'] = 10
+        entities[0]['baz']
+        self.em.flush()
+        stmts = streaming_bulk.call_args[0][1]
+        self.assertEqual([stmt['doc'] for stmt in stmts], [{'foo': 10}])
+        entities[0]['tags'].append('b')
+        self.em.flush()
+        stmts = streaming_bulk.call_args[0][1]
+        self.assertEqual([stmt['doc'] for stmt in stmts], [{'tags': ['a', 'b']}])
+
+    @patch('elasticdata.manager.helpers.streaming_bulk')
+    def test_cleared(self, streaming_bulk):
+        streaming_bulk.return_value = []
+        entities, meta = self.em.query({'query': {'match_all': {}}}, DeferredTestType, scope='small')
+        self.em.clear()
+        entities[0]['tags'].append('b')
+        self.em.flush()
+        self.assertEqual(streaming_bulk.call_args[0][1], [])
+        self.assertEqual(len(self.em._watched), 0)
+
+    def test_unscoped(self):
+        entities, meta = self.em.query({'query': {'match_all': {}}}, DeferredTestType)
+        self.assertRaises(KeyError, lambda: entities[0]['baz'])
+        self.assertEqual(self.client.mget.call_count, 0)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+
+from elasticdata.dump import open_dump, dump, read_actions, load, Progress
+
+
+def fake_scan(client, **kwargs):
+    for i in range(5):
+        yield {'_index': 'source', '_type': 'dump_type', '_id': str(i), '_source': {'foo': i}}
+
+
+def fake_bulk(client, actions, **kwargs):
+    for action in actions:
+        yield action['_id'] != '3', action
+
+
+class DumpTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @patch('elasticdata.dump.helpers.scan', fake_scan)
+    @patch('elasticdata.dump.helpers.streaming_bulk', fake_bulk)
+    def test_dump_load(self):
+        path = os.path.join(self.tmp_dir, 'dump.json.gz')
+        reports = []
+        with open_dump(path, 'w') as f:
+            self.assertEqual(dump(Mock(), f, 'source', progress=Progress(lambda c, r: reports.append(c), 2)), 5)
+        self.assertEqual(reports, [2, 4])
+        with open_dump(path) as f:
+            actions = list(read_actions(f, index='target'))
+        self.assertEqual([a['_id'] for a in actions], ['0', '1', '2', '3', '4'])
+        self.assertDictEqual(actions[0], {'_op_type': 'index', '_index': 'target', '_type': 'dump_type',
+                                          '_id': '0', '_source': {'foo': 0}})
+        with open_dump(path) as f:
+            count, errors = load(Mock(), f, threads=3)
+        self.assertEqual(count, 4)
+        self.assertEqual([e['_id'] for e in errors], ['3'])
+
+    def test_read_skips_empty_lines(self):
+        f = io.BytesIO(b'{"_id": "1"}\n\n{"_id": "2"}\n')
+        self.assertEqual([a['_id'] for a in read_actions(f)], ['1', '2'])
@@ -2,8 +2,10 @@
 from __future__ import unicode_literals
 
 from unittest import TestCase
+from datetime import datetime
 
 from elasticdata import Type, TimestampedType, ValidationError
+from elasticdata.type import CONTENT
 
 
 class TestType(Type):
@@ -56,6 +58,37 @@ class ContextTestType(TestType):
             raise ValidationError()
 
 
+class FixedIndexTestType(Type):
+    class Meta:
+        index = 'fixed'
+
+
+class TimeBasedTestType(TimestampedType):
+    class Meta:
+        index = 'events-%Y.%m'
+        index_date_field = 'created_at'
+
+
+class AliasedTimeBasedTestType(TimeBasedTestType):
+    class Meta:
+        read_index = 'events'
+
+
+class RoutedTestType(Type):
+    class Meta:
+        routing = 'tenant_id'
+
+
+class KeyedTestType(Type):
+    class Meta:
+        key_fields = ('source', 'number')
+
+
+class ContentKeyedTestType(TimestampedType):
+    class Meta:
+        key_fields = CONTENT
+
+
 class TypeTestCase(TestCase):
     def setUp(self):
         self.DATA = {'foo': 'bar', 'bar': 'baz', 'baz': 'foo'}
@@ -150,3 +183,40 @@ class TypeTestCase(TestCase):
         self.assertEqual(te.highlight, {'field': 'data'})
         te = TestType()
         self.assertIsNone(te.highlight)
+
+    def test_index(self):
+        self.assertEqual(TestType.get_index('default'), 'default')
+        self.assertEqual(TestType().get_storage_index('default'), 'default')
+        self.assertEqual(FixedIndexTestType.get_index('default'), 'fixed')
+        self.assertEqual(FixedIndexTestType().get_storage_index('default'), 'fixed')
+        self.assertFalse(FixedIndexTestType.is_time_based())
+        self.assertTrue(TimeBasedTestType.is_time_based())
+        self.assertEqual(TimeBasedTestType.get_index('default'), 'events-*.*')
+        self.assertEqual(AliasedTimeBasedTestType.get_index('default'), 'events')
+        te = TimeBasedTestType({'created_at': datetime(2014, 10, 1)})
+        self.assertEqual(te.get_storage_index('default'), 'events-2014.10')
+        te = TimeBasedTestType({'created_at': '2014-09-01T12:00:00.123'})
+        self.assertEqual(te.get_storage_index('default'), 'events-2014.09')
+        te = TimeBasedTestType()
+        self.assertEqual(te.get_storage_index('default'), datetime.now().strftime('events-%Y.%m'))
+
+    def test_routing(self):
+        self.assertIsNone(TestType.get_routing_field())
+        self.assertIsNone(TestType({'tenant_id': 1}).get_routing())
+        self.assertEqual(RoutedTestType.get_routing_field(), 'tenant_id')
+        self.assertEqual(RoutedTestType({'tenant_id': 1}).get_routing(), '1')
+        self.assertEqual(RoutedTestType({'_routing': '2'}).get_routing(), '2')
+        self.assertIsNone(RoutedTestType().get_routing())
+
+    def test_key_id(self):
+        self.assertIsNone(TestType({'foo': 'bar'}).get_key_id())
+        e = KeyedTestType({'source': 'feed', 'number': 1, 'foo': 'bar'})
+        same = KeyedTestType({'source': 'feed', 'number': 1, 'foo': 'baz'})
+        self.assertEqual(e.get_key_id(), same.get_key_id())
+        self.assertNotEqual(e.get_key_id(), KeyedTestType({'source': 'feed', 'number': 2}).get_key_id())
+        self.assertEqual(len(e.get_key_id()), 40)
+        self.assertRaises(ValidationError, KeyedTestType({'source': 'feed'}).get_key_id)
+        e = ContentKeyedTestType({'foo': 'bar', 'date': datetime(2014, 10, 1), 'created_at': datetime.now()})
+        same = ContentKeyedTestType({'date': datetime(2014, 10, 1), 'foo': 'bar'})
+        self.assertEqual(e.get_key_id(), same.get_key_id())
+        self.assertNotEqual(e.get_key_id(), ContentKeyedTestType({'foo': 'bar'}).get_key_id())
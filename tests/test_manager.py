@@ -6,20 +6,24 @@ import string
 from unittest import TestCase
 from mock import patch
 from datetime import datetime
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, ConnectionError
+from elasticsearch.helpers import BulkIndexError
 
 from elasticdata.manager import (
     without,
     group,
     PersistedEntity,
+    AtomicUpdate,
     EntityManager,
     UPDATE,
     REMOVE,
     ADD,
+    MERGE,
     RepositoryError,
     EntityNotFound
 )
 from elasticdata import Type, TimestampedType
+from elasticdata.refresh import WAIT
 
 
 class ManagerTestType(Type):
@@ -30,6 +34,42 @@ class ManagerTestType(Type):
         }
 
 
+class ManagerTimestampedTestType(TimestampedType):
+    pass
+
+
+class ManagerTimeBasedTestType(Type):
+    class Meta:
+        index = 'elasticdata-test-%Y.%m'
+        index_date_field = 'date'
+
+
+class ManagerRoutedTestType(Type):
+    class Meta:
+        routing = 'tenant_id'
+
+
+class ManagerKeyedTestType(Type):
+    class Meta:
+        key_fields = ('number', )
+
+
+class ManagerFormattedTestType(TimestampedType):
+    def repr_created_at(self, value):
+        return value.isoformat()
+
+    def repr_updated_at(self, value):
+        return value.isoformat()
+
+
+class ManagerJoinedTestType(Type):
+    def repr_tags(self, value):
+        return ','.join(value or [])
+
+    def reset_tags(self):
+        self._data['tags'] = []
+
+
 class ManagerCallbacksTestType(Type):
     def pre_create(self, em):
         self['pre_create'] = self.get('foo', None)
@@ -143,6 +183,182 @@ class PersistedEntityTestCase(TestCase):
             '_type': 'manager_test_type'
         })
 
+    def test_entity_index(self):
+        e = ManagerTimeBasedTestType({'foo': 'bar', 'date': datetime(2014, 10, 1)})
+        pe = PersistedEntity(e)
+        self.assertEqual(pe.stmt['_index'], 'elasticdata-test-2014.10')
+        e = ManagerTimeBasedTestType({'foo': 'bar', 'id': '1', '_index': 'elasticdata-test-2014.09'})
+        pe = PersistedEntity(e, state=REMOVE)
+        self.assertEqual(pe.stmt['_index'], 'elasticdata-test-2014.09')
+
+    def test_entity_routing(self):
+        e = ManagerRoutedTestType({'foo': 'bar', 'tenant_id': 5})
+        self.assertEqual(PersistedEntity(e).stmt['_routing'], '5')
+        e = ManagerRoutedTestType({'foo': 'bar', 'id': '1', '_routing': '5'}, scope='small')
+        pe = PersistedEntity(e, state=UPDATE)
+        e['foo'] = 'baz'
+        self.assertEqual(pe.stmt['_routing'], '5')
+        self.assertEqual(PersistedEntity(e, state=REMOVE).stmt['_routing'], '5')
+
+    def test_merge_entity(self):
+        e = ManagerTestType({'foo': 'bar'})
+        pe = PersistedEntity(e, state=MERGE)
+        self.assertFalse(pe.is_action_needed())
+        e = ManagerTestType({'foo': 'bar', 'id': '1'})
+        pe = PersistedEntity(e, state=MERGE)
+        self.assertTrue(pe.is_action_needed())
+        self.assertDictEqual(pe.stmt, {
+            '_id': '1',
+            '_index': 'default',
+            '_op_type': 'update',
+            '_type': 'manager_test_type',
+            'doc': {'foo': 'bar'},
+            'doc_as_upsert': True
+        })
+        e = TimestampedType({'foo': 'bar', 'id': '1'})
+        stmt = PersistedEntity(e, state=MERGE).stmt
+        self.assertNotIn('doc_as_upsert', stmt)
+        self.assertNotIn('created_at', stmt['doc'])
+        self.assertEqual(stmt['upsert']['created_at'], stmt['doc']['updated_at'])
+        self.assertNotIn('created_at', e)
+        e = ManagerFormattedTestType({'foo': 'bar', 'id': '1'})
+        stmt = PersistedEntity(e, state=MERGE).stmt
+        self.assertEqual(stmt['doc']['updated_at'], e['updated_at'].isoformat())
+        self.assertEqual(stmt['upsert']['created_at'], e['updated_at'].isoformat())
+
+    @patch('elasticdata.manager.helpers.streaming_bulk')
+    def test_derived_id_conflict(self, streaming_bulk):
+        conflict = {'create': {'_index': 'default', '_type': 'manager_keyed_test_type', '_id': 'x', 'status': 409,
+                               'error': 'DocumentAlreadyExistsException'}}
+        streaming_bulk.return_value = [(False, conflict)]
+        em = EntityManager()
+        e = ManagerKeyedTestType({'number': 1})
+        em.persist(e)
+        em.flush()
+        stmt = streaming_bulk.call_args[0][1][0]
+        self.assertEqual(stmt['_id'], e.get_key_id())
+        self.assertFalse(streaming_bulk.call_args[1]['raise_on_error'])
+        self.assertEqual(e['id'], 'x')
+        em.persist(ManagerTestType({'foo': 'bar', 'id': '1'}))
+        streaming_bulk.return_value = [(False, dict(conflict, create=dict(conflict['create'], _id='1')))]
+        self.assertRaises(BulkIndexError, em.flush)
+
+
+class PendingChangesTestCase(TestCase):
+    def test_pending(self):
+        em = EntityManager()
+        e = ManagerTestType({'foo': 'bar', 'id': '1'})
+        e2 = ManagerTestType({'foo': 'bar', 'id': '2', 'tags': ['a']})
+        em._persist(e, state=UPDATE)
+        em._persist(e2, state=UPDATE)
+        self.assertEqual(len(em._pending), 0)
+        self.assertEqual(em._watched, {e2._persisted_entity})
+        e['foo'] = 'baz'
+        self.assertEqual(em._pending, {e._persisted_entity})
+        em.clear()
+        e['foo'] = 'bar'
+        self.assertEqual(len(em._pending), 0)
+
+    @patch('elasticdata.manager.helpers.streaming_bulk')
+    def test_flush_pending(self, streaming_bulk):
+        streaming_bulk.return_value = []
+        em = EntityManager()
+        entities = [ManagerTestType({'foo': 'bar', 'id': str(i)}) for i in range(10)]
+        for e in entities:
+            em._persist(e, state=UPDATE)
+        entities[3]['foo'] = 'baz'
+        em.flush()
+        stmts = streaming_bulk.call_args[0][1]
+        self.assertEqual([stmt['_id'] for stmt in stmts], ['3'])
+        self.assertEqual(len(em._pending), 0)
+        em.flush()
+        self.assertEqual(streaming_bulk.call_args[0][1], [])
+        e = ManagerTestType({'foo': 'bar'})
+        em.persist(e)
+        em.remove(e)
+        em.flush()
+        self.assertEqual(streaming_bulk.call_args[0][1], [])
+
+    @patch('elasticdata.manager.helpers.streaming_bulk')
+    def test_flush_in_place(self, streaming_bulk):
+        streaming_bulk.return_value = []
+        em = EntityManager()
+        e = ManagerJoinedTestType({'tags': ['a'], 'id': '1'})
+        em._persist(e, state=UPDATE)
+        e['tags'].append('b')
+        em.flush()
+        self.assertEqual(streaming_bulk.call_args[0][1][0]['doc'], {'tags': 'a,b'})
+        e.reset_tags()
+        em.flush()
+        self.assertEqual(streaming_bulk.call_args[0][1][0]['doc'], {'tags': ''})
+
+    @patch('elasticdata.manager.helpers.streaming_bulk')
+    def test_flush_created(self, streaming_bulk):
+        streaming_bulk.return_value = [(True, {'create': {'_index': 'default', '_id': str(i), 'status': 201}})
+                                       for i in range(3)]
+        em = EntityManager()
+        entities = [ManagerTimestampedTestType({'foo': 'bar'}) for _ in range(3)]
+        for e in entities:
+            em.persist(e)
+        em.flush()
+        self.assertEqual(sorted(e['id'] for e in entities), ['0', '1', '2'])
+        self.assertEqual(len(em._pending), 0)
+        em.flush()
+        self.assertEqual(streaming_bulk.call_args[0][1], [])
+
+    @patch('elasticdata.manager.helpers.streaming_bulk')
+    def test_flush_failed(self, streaming_bulk):
+        streaming_bulk.side_effect = ConnectionError('N/A', 'refused')
+        em = EntityManager()
+        e = ManagerTestType({'foo': 'bar', 'id': '1'})
+        em._persist(e, state=UPDATE)
+        e['foo'] = 'baz'
+        em.increment('1', 'counter', _type=ManagerTestType)
+        self.assertRaises(ConnectionError, em.flush)
+        streaming_bulk.side_effect = None
+        streaming_bulk.return_value = [(True, {'update': {'status': 200}})] * 2
+        em.flush()
+        stmts = streaming_bulk.call_args[0][1]
+        self.assertEqual([stmt['_id'] for stmt in stmts], ['1', '1'])
+        self.assertEqual(stmts[0]['doc'], {'foo': 'baz'})
+        self.assertEqual(len(em._pending), 0)
+
+
+class AtomicUpdateTestCase(TestCase):
+    def test_stmt(self):
+        au = AtomicUpdate('increment', '1', 'manager_test_type', 'counter', 2)
+        self.assertDictEqual(au.stmt, {
+            '_id': '1',
+            '_index': 'default',
+            '_op_type': 'update',
+            '_type': 'manager_test_type',
+            'lang': 'groovy',
+            'script': AtomicUpdate.SCRIPTS['increment'],
+            'params': {'field': 'counter', 'value': 2}
+        })
+        au = AtomicUpdate('append', '1', 'manager_test_type', 'tags', 'a', parent='2', upsert={'tags': ['a']})
+        self.assertEqual(au.stmt['_parent'], '2')
+        self.assertDictEqual(au.stmt['upsert'], {'tags': ['a']})
+        self.assertRaises(ValueError, AtomicUpdate, 'unknown', '1', 'manager_test_type', 'foo', 1)
+        au = AtomicUpdate('increment', '1', 'manager_test_type', 'counter', 1, routing='5')
+        self.assertEqual(au.stmt['_routing'], '5')
+        with patch.object(AtomicUpdate, 'SCRIPT_FILES', {'increment': 'elasticdata_increment'}):
+            stmt = AtomicUpdate('increment', '1', 'manager_test_type', 'counter', 1).stmt
+        self.assertEqual(stmt['script_file'], 'elasticdata_increment')
+        self.assertNotIn('script', stmt)
+
+    def test_queue(self):
+        em = EntityManager()
+        em.increment('1', 'counter', _type=ManagerTestType)
+        em.append_to(ManagerTestType({'id': '2'}), 'tags', 'a')
+        em.increment(ManagerRoutedTestType({'id': '3', 'tenant_id': 't'}), 'counter')
+        self.assertEqual([o.stmt['_id'] for o in em._operations], ['1', '2', '3'])
+        self.assertEqual(em._operations[2].stmt['_routing'], 't')
+        self.assertRaises(RepositoryError, em.increment, '1', 'counter')
+        self.assertRaises(RepositoryError, em.increment, ManagerTestType({'foo': 'bar'}), 'counter')
+        em.clear()
+        self.assertEqual(len(em._operations), 0)
+
 
 class EntityManagerTestCase(TestCase):
     @classmethod
@@ -172,11 +388,16 @@ class EntityManagerTestCase(TestCase):
 
     def test_remove(self):
         em = self.em
-        e = ManagerTestType({'foo': 'bar'})
+        e = ManagerTestType({'foo': 'bar', 'id': '1'})
         em.persist(e)
         self.assertEqual(list(em._registry.values())[0].state, ADD)
         em.remove(e)
         self.assertEqual(list(em._registry.values())[0].state, REMOVE)
+        e2 = ManagerTestType({'foo': 'bar'})
+        em.persist(e2)
+        em.remove(e2)
+        self.assertEqual(len(em._registry), 1)
+        self.assertEqual(len(em._pending), 1)
 
     def test_flush(self):
         em = self.em
@@ -256,7 +477,8 @@ class EntityManagerTestCase(TestCase):
         em.persist(e2)
         em.flush()
         em.get_client().indices.refresh(index=self._index)
-        self.assertRaises(RepositoryError, em2.query_one, {'query': {'term': {'foo': {'value': 'bar'}}}}, ManagerTestType)
+        self.assertRaises(RepositoryError, em2.query_one, {'query': {'term': {'foo': {'value': 'bar'}}}},
+                          ManagerTestType)
 
     def test_find_scope(self):
         em = self.em
@@ -402,6 +624,84 @@ class EntityManagerTestCase(TestCase):
         em.clear()
         self.assertEqual(len(em._registry), 0)
 
+    def test_flush_wait_refresh(self):
+        em = self.em
+        e = ManagerTestType({'foo': 'refreshed'})
+        em.persist(e)
+        em.flush(refresh=WAIT)
+        fe, meta = self.em.query({'query': {'term': {'foo': {'value': 'refreshed'}}}}, ManagerTestType)
+        self.assertEqual(len(fe), 1)
+
+    def test_time_based_index(self):
+        em = self.em
+        e = ManagerTimeBasedTestType({'foo': 'bar', 'date': datetime(2014, 10, 1)})
+        e2 = ManagerTimeBasedTestType({'foo': 'baz', 'date': datetime(2014, 9, 1)})
+        em.persist(e)
+        em.persist(e2)
+        em.flush()
+        self.assertEqual(e['_index'], 'elasticdata-test-2014.10')
+        self.assertEqual(e2['_index'], 'elasticdata-test-2014.09')
+        em.get_client().indices.refresh(index='elasticdata-test-*')
+        fe = self.em.find(e['id'], ManagerTimeBasedTestType)
+        self.assertEqual(fe['_index'], 'elasticdata-test-2014.10')
+        fe = self.em.find_many([e2['id'], e['id']], ManagerTimeBasedTestType)
+        self.assertEqual([f['foo'] for f in fe], ['baz', 'bar'])
+        self.assertRaises(EntityNotFound, self.em.find, 'non-exists', ManagerTimeBasedTestType)
+        em.get_client().indices.delete(index='elasticdata-test-*')
+
+    def test_routing(self):
+        em = self.em
+        e = ManagerRoutedTestType({'foo': 'bar', 'tenant_id': 't1'})
+        e2 = ManagerRoutedTestType({'foo': 'bar', 'tenant_id': 't2'})
+        em.persist(e)
+        em.persist(e2)
+        em.flush()
+        em.get_client().indices.refresh(index=self._index)
+        fe = self.em.find(e['id'], ManagerRoutedTestType, routing='t1', scope='small')
+        self.assertEqual(fe['_routing'], 't1')
+        fe = self.em.find_many([e['id'], e2['id']], ManagerRoutedTestType,
+                               routing={e['id']: 't1', e2['id']: 't2'})
+        self.assertEqual([f['tenant_id'] for f in fe], ['t1', 't2'])
+        fe, meta = self.em.query({'query': {'term': {'foo': {'value': 'bar'}}}}, ManagerRoutedTestType,
+                                 routing='t2')
+        self.assertEqual([f['id'] for f in fe], [e2['id']])
+
+    def test_merge(self):
+        em = self.em
+        e = TimestampedType({'foo': 'bar', 'id': 'merged'})
+        em.merge(e)
+        em.flush()
+        fe = self.em.find('merged', TimestampedType)
+        self.assertEqual(fe['foo'], 'bar')
+        self.assertEqual(fe['created_at'], fe['updated_at'])
+        e2 = TimestampedType({'foo': 'baz', 'id': 'merged'})
+        em.merge(e2)
+        em.flush()
+        fe = self.em.find('merged', TimestampedType)
+        self.assertEqual(fe['foo'], 'baz')
+        self.assertTrue(fe['created_at'] < fe['updated_at'])
+        self.assertRaises(RepositoryError, em.merge, TimestampedType({'foo': 'bar'}))
+
+    def test_atomic_operations(self):
+        em = self.em
+        e = ManagerTestType({'foo': 'bar', 'counter': 1, 'tags': ['a', 'b']})
+        em.persist(e)
+        em.flush()
+        em.increment(e, 'counter', 2)
+        em.append_to(e['id'], 'tags', 'c', _type=ManagerTestType)
+        em.remove_from(e, 'tags', 'a')
+        em.set_if_absent(e, 'foo', 'baz')
+        em.set_if_absent(e, 'bar', 'baz')
+        em.flush()
+        fe = self.em.find(e['id'], ManagerTestType)
+        self.assertEqual(fe['counter'], 3)
+        self.assertEqual(fe['tags'], ['b', 'c'])
+        self.assertEqual(fe['foo'], 'bar')
+        self.assertEqual(fe['bar'], 'baz')
+        em.increment('counter-doc', 'counter', _type=ManagerTestType, upsert={'counter': 1})
+        em.flush()
+        self.assertEqual(self.em.find('counter-doc', ManagerTestType)['counter'], 1)
+
     def test_highlight_query(self):
         em = self.em
         em2 = self.em
@@ -409,5 +709,6 @@ class EntityManagerTestCase(TestCase):
         em.persist(e)
         em.flush()
         em.get_client().indices.refresh(index=self._index)
-        fe, meta = em2.query({'query': {'match': {'foo': 'bar'}}, 'highlight': {'fields': {'foo': {}}}}, ManagerTestType)
+        fe, meta = em2.query({'query': {'match': {'foo': 'bar'}}, 'highlight': {'fields': {'foo': {}}}},
+                             ManagerTestType)
         self.assertDictEqual(fe[0].highlight, {'foo': ['<em>bar</em> foo']})
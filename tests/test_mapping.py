@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase
+from mock import Mock
+
+from elasticdata import Type, TimestampedType
+from elasticdata.mapping import (
+    get_mapped_types,
+    build_index_body,
+    build_template,
+    apply_mappings,
+    compare_properties,
+    get_mapping_drift
+)
+
+
+class MappedTestType(Type):
+    class Meta:
+        mapping = {
+            'foo': {'type': 'string', 'index': 'not_analyzed', 'doc_values': True},
+            'bar': {'type': 'string', 'norms': {'enabled': False}}
+        }
+        mapping_options = {'_all': {'enabled': False}}
+        index_settings = {'number_of_shards': 2}
+
+
+class ExtendedMappedTestType(MappedTestType):
+    class Meta:
+        mapping = {'baz': {'type': 'long'}}
+        routing = 'baz'
+
+
+class TimeBasedMappedTestType(TimestampedType):
+    class Meta:
+        index = 'mapped-%Y.%m'
+        index_date_field = 'created_at'
+        mapping = {'foo': {'type': 'string', 'index': 'not_analyzed'}}
+
+
+class AliasedTimeBasedMappedTestType(TimestampedType):
+    class Meta:
+        index = 'events-%Y.%m'
+        index_date_field = 'created_at'
+        read_index = 'events'
+        mapping = {'foo': {'type': 'string'}}
+
+
+class AliasedMappedTestType(Type):
+    class Meta:
+        index = 'users_v2'
+        read_index = 'users'
+        mapping = {'foo': {'type': 'string'}}
+
+
+class MappingTestCase(TestCase):
+    def test_type_mapping(self):
+        self.assertDictEqual(MappedTestType.get_mapping(), {
+            '_all': {'enabled': False},
+            'properties': {
+                'foo': {'type': 'string', 'index': 'not_analyzed', 'doc_values': True},
+                'bar': {'type': 'string', 'norms': {'enabled': False}}
+            }
+        })
+        mapping = ExtendedMappedTestType.get_mapping()
+        self.assertEqual(sorted(mapping['properties'].keys()), ['bar', 'baz', 'foo'])
+        self.assertEqual(mapping['_routing'], {'required': True})
+        self.assertNotIn('baz', MappedTestType.get_mapping()['properties'])
+        self.assertEqual(TimeBasedMappedTestType.get_mapping()['properties']['created_at'], {'type': 'date'})
+        self.assertIn(MappedTestType, get_mapped_types())
+        self.assertNotIn(Type, get_mapped_types())
+
+    def test_build(self):
+        body = build_index_body([MappedTestType, ExtendedMappedTestType])
+        self.assertEqual(body['settings'], {'number_of_shards': 2})
+        self.assertEqual(sorted(body['mappings'].keys()), ['extended_mapped_test_type', 'mapped_test_type'])
+        template = build_template('mapped-*', [TimeBasedMappedTestType])
+        self.assertEqual(template['template'], 'mapped-*')
+        self.assertNotIn('settings', template)
+
+    def test_apply(self):
+        client = Mock()
+        client.indices.exists.return_value = False
+        apply_mappings(client, [MappedTestType, TimeBasedMappedTestType], default_index='test')
+        client.indices.create.assert_called_with(index='test', body=build_index_body([MappedTestType]))
+        client.indices.put_template.assert_called_with(
+            name='elasticdata-mapped', body=build_template('mapped-*.*', [TimeBasedMappedTestType]))
+        client.indices.exists.return_value = True
+        apply_mappings(client, [MappedTestType], default_index='test')
+        client.indices.put_mapping.assert_called_with(
+            index='test', doc_type='mapped_test_type', body={'mapped_test_type': MappedTestType.get_mapping()})
+
+    def test_apply_read_index(self):
+        client = Mock()
+        client.indices.exists.return_value = False
+        apply_mappings(client, [AliasedMappedTestType, AliasedTimeBasedMappedTestType], default_index='test')
+        client.indices.exists.assert_called_with(index='users_v2')
+        index_body = client.indices.create.call_args[1]['body']
+        self.assertEqual(client.indices.create.call_args[1]['index'], 'users_v2')
+        self.assertEqual(index_body['aliases'], {'users': {}})
+        template = client.indices.put_template.call_args[1]['body']
+        self.assertEqual(template['template'], 'events-*.*')
+        self.assertEqual(template['aliases'], {'events': {}})
+        self.assertEqual(AliasedMappedTestType.get_index('test'), 'users')
+        self.assertEqual(AliasedMappedTestType.get_write_index_pattern('test'), 'users_v2')
+
+    def test_drift(self):
+        declared = MappedTestType.get_mapping()['properties']
+        self.assertEqual(compare_properties(declared, {
+            'foo': {'type': 'string', 'index': 'not_analyzed', 'doc_values': True},
+            'bar': {'type': 'string', 'norms': {'enabled': False}}
+        }), [])
+        drift = compare_properties(declared, {
+            'foo': {'type': 'string'},
+            'qux': {'type': 'string'}
+        })
+        self.assertEqual(sorted(d[0] for d in drift), ['bar', 'foo', 'qux'])
+        client = Mock()
+        client.indices.get_mapping.return_value = {'test': {'mappings': {'mapped_test_type': {'properties': {
+            'foo': {'type': 'string', 'index': 'not_analyzed', 'doc_values': True},
+        }}}}}
+        drift = get_mapping_drift(client, [MappedTestType], default_index='test')
+        self.assertEqual(drift, [('test', 'mapped_test_type', 'bar', declared['bar'], None)])
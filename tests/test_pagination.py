@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from unittest import TestCase
+from mock import Mock
+
+from elasticdata import Type, EntityManager, RepositoryError
+from elasticdata.pagination import (normalize_sort, with_tie_breaker, is_score_sorted, after_filter,
+                                   encode_cursor, decode_cursor)
+
+
+class PagedTestType(Type):
+    pass
+
+
+def hit(_id, date):
+    return {'_index': 'test', '_type': 'paged_test_type', '_id': _id, '_score': None, '_source': {'date': date},
+            'sort': [date, 'paged_test_type#' + _id]}
+
+
+class PaginationTestCase(TestCase):
+    def test_normalize_sort(self):
+        self.assertEqual(normalize_sort(None), [('_score', 'desc'), ('_uid', 'asc')])
+        self.assertEqual(normalize_sort([{'date': 'desc'}, 'name']),
+                         [('date', 'desc'), ('name', 'asc'), ('_uid', 'asc')])
+        self.assertEqual(normalize_sort({'date': {'order': 'desc'}}), [('date', 'desc'), ('_uid', 'asc')])
+        self.assertEqual(normalize_sort([{'_uid': 'desc'}]), [('_uid', 'desc')])
+        self.assertTrue(is_score_sorted(normalize_sort(None)))
+        self.assertFalse(is_score_sorted(normalize_sort('date')))
+        self.assertRaises(ValueError, normalize_sort, {'price': {'order': 'asc', 'missing': '_first'}})
+        self.assertRaises(ValueError, normalize_sort, {'_geo_distance': {'location': [0, 0], 'order': 'asc'}})
+
+    def test_with_tie_breaker(self):
+        sort = [{'price': {'order': 'asc', 'mode': 'avg', 'missing': '_last'}}, 'name']
+        self.assertEqual(with_tie_breaker(sort), sort + [{'_uid': 'asc'}])
+        self.assertEqual(with_tie_breaker(None), ['_score', {'_uid': 'asc'}])
+        self.assertEqual(with_tie_breaker({'_uid': 'desc'}), [{'_uid': 'desc'}])
+
+    def test_after_filter(self):
+        self.assertEqual(after_filter([('date', 'desc'), ('_uid', 'asc')], [10, 't#1']), {'bool': {'should': [
+            {'bool': {'must': [
+                {'bool': {'should': [{'range': {'date': {'lt': 10}}}, {'missing': {'field': 'date'}}]}}
+            ]}},
+            {'bool': {'must': [{'term': {'date': 10}}, {'range': {'_uid': {'gt': 't#1'}}}]}}
+        ]}})
+
+    def test_after_filter_missing(self):
+        self.assertEqual(after_filter([('date', 'asc'), ('_uid', 'asc')], [None, 't#1']), {'bool': {'should': [
+            {'bool': {'must': [{'missing': {'field': 'date'}}, {'range': {'_uid': {'gt': 't#1'}}}]}}
+        ]}})
+
+    def test_cursor(self):
+        self.assertEqual(decode_cursor(encode_cursor({'s': [1, 'a']})), {'s': [1, 'a']})
+        self.assertRaises(ValueError, decode_cursor, 'invalid')
+
+    def test_query_page(self):
+        client = Mock()
+        client.search.return_value = {'hits': {'total': 3, 'max_score': None,
+                                               'hits': [hit('1', 30), hit('2', 20)]}}
+        em = EntityManager(index='test', client=client)
+        query = {'query': {'term': {'foo': 'bar'}}, 'sort': [{'date': {'order': 'desc', 'mode': 'max'}}],
+                 'from': 5}
+        entities, meta, cursor = em.query_page(query, PagedTestType, size=2)
+        self.assertEqual([e['id'] for e in entities], ['1', '2'])
+        body = client.search.call_args[1]['body']
+        self.assertEqual(body['sort'], [{'date': {'order': 'desc', 'mode': 'max'}}, {'_uid': 'asc'}])
+        self.assertEqual(body['size'], 2)
+        self.assertEqual(body['from'], 5)
+        client.search.return_value = {'hits': {'total': 3, 'max_score': None, 'hits': [hit('3', 10)]}}
+        entities, meta, next_cursor = em.query_page(query, PagedTestType, size=2, cursor=cursor)
+        body = client.search.call_args[1]['body']
+        self.assertEqual(body['query']['filtered']['query'], {'term': {'foo': 'bar'}})
+        self.assertEqual(body['query']['filtered']['filter'],
+                         after_filter([('date', 'desc'), ('_uid', 'asc')], [20, 'paged_test_type#2']))
+        self.assertNotIn('from', body)
+        self.assertIsNone(next_cursor)
+        self.assertRaises(RepositoryError, em.query_page, query, PagedTestType, cursor='invalid')
+        self.assertRaises(RepositoryError, em.query_page, {'sort': {'date': {'missing': '_first'}}},
+                          PagedTestType)
+
+    def test_query_page_by_score(self):
+        client = Mock()
+        client.search.return_value = {'hits': {'total': 3, 'max_score': 1.0,
+                                               'hits': [hit('1', 30), hit('2', 20)]}}
+        em = EntityManager(index='test', client=client)
+        entities, meta, cursor = em.query_page({'query': {'match': {'foo': 'bar'}}}, PagedTestType, size=2)
+        em.query_page({'query': {'match': {'foo': 'bar'}}}, PagedTestType, size=2, cursor=cursor)
+        self.assertEqual(client.search.call_args[1]['body']['from'], 2)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+from unittest import TestCase
+from mock import Mock
+from elasticsearch import TransportError
+
+from elasticdata.refresh import RefreshCoalescer
+
+
+class RefreshCoalescerTestCase(TestCase):
+    def test_coalesce(self):
+        client = Mock()
+        coalescer = RefreshCoalescer(window=0.05)
+        pending = []
+
+        def request(index):
+            pending.append(coalescer.request(client, index))
+
+        threads = [threading.Thread(target=request, args=(index, )) for index in ['a'] * 10 + ['b'] * 5]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for pending_refresh in pending:
+            pending_refresh.wait()
+            self.assertTrue(pending_refresh.done)
+        self.assertEqual(client.indices.refresh.call_count, 2)
+        coalescer.request(client, 'a').wait()
+        self.assertEqual(client.indices.refresh.call_count, 3)
+
+    def test_error(self):
+        client = Mock()
+        client.indices.refresh.side_effect = TransportError(500, 'error')
+        pending = RefreshCoalescer(window=0).request(client, 'a')
+        self.assertRaises(TransportError, pending.wait)
+
+    def test_clusters(self):
+        client, other_client = Mock(), Mock()
+        coalescer = RefreshCoalescer(window=0.01)
+        pending = coalescer.request(client, 'default')
+        other_pending = coalescer.request(other_client, 'default')
+        self.assertIsNot(pending, other_pending)
+        pending.wait()
+        other_pending.wait()
+        client.indices.refresh.assert_called_once_with(index='default')
+        other_client.indices.refresh.assert_called_once_with(index='default')
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+from elasticsearch import NotFoundError
+
+from elasticdata import Type, RepositoryError
+from elasticdata.reindex import Checkpoint, hit_to_action, get_slices, swap_alias, reindex
+
+
+class ReindexTestType(Type):
+    def repr_foo(self, value):
+        return value.upper()
+
+
+def fake_bulk(client, actions, **kwargs):
+    for action in actions:
+        yield action['_id'] != 'bad', action
+
+
+def fake_scan(client, preference=None, **kwargs):
+    shard = preference.split(':')[1]
+    for i in range(3):
+        yield {'_type': 'reindex_test_type', '_id': '{0}-{1}'.format(shard, i), '_source': {'foo': 'bar'}}
+
+
+class ReindexTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hit_to_action(self):
+        hit = {'_type': 'reindex_test_type', '_id': '1', '_source': {'foo': 'bar'}, 'fields': {'_routing': 'r'}}
+        self.assertDictEqual(hit_to_action(hit, 'target'), {
+            '_op_type': 'index',
+            '_index': 'target',
+            '_type': 'reindex_test_type',
+            '_id': '1',
+            '_routing': 'r',
+            '_source': {'foo': 'bar'}
+        })
+        action = hit_to_action(hit, 'target', types={'reindex_test_type': ReindexTestType})
+        self.assertEqual(action['_source'], {'foo': 'BAR'})
+        self.assertIsNone(hit_to_action(hit, 'target', transform=lambda a: None))
+
+    def test_checkpoint(self):
+        path = os.path.join(self.tmp_dir, 'checkpoint.json')
+        checkpoint = Checkpoint(path)
+        checkpoint.mark(0, 10)
+        checkpoint.mark(2, 5)
+        checkpoint = Checkpoint(path)
+        self.assertEqual(checkpoint.completed, {0, 2})
+        self.assertEqual(checkpoint.count, 15)
+
+    def test_slices_and_alias(self):
+        client = Mock()
+        client.indices.get_settings.return_value = {'source': {'settings': {'index': {'number_of_shards': '3'}}}}
+        self.assertEqual(get_slices(client, 'source'), [0, 1, 2])
+        client.indices.get_settings.return_value = {
+            'events-2014.09': {'settings': {'index': {'number_of_shards': '2'}}},
+            'events-2014.10': {'settings': {'index': {'number_of_shards': '3'}}}
+        }
+        self.assertEqual(get_slices(client, 'events'), [0, 1, 2])
+        client.indices.get_alias.return_value = {'old': {'aliases': {'alias': {}}}}
+        swap_alias(client, 'alias', 'new')
+        client.indices.update_aliases.assert_called_with(body={'actions': [
+            {'remove': {'index': 'old', 'alias': 'alias'}},
+            {'add': {'index': 'new', 'alias': 'alias'}}
+        ]})
+        client.indices.get_alias.side_effect = NotFoundError(404, 'missing')
+        swap_alias(client, 'alias', 'new')
+        client.indices.update_aliases.assert_called_with(
+            body={'actions': [{'add': {'index': 'new', 'alias': 'alias'}}]})
+
+    @patch('elasticdata.reindex.helpers.streaming_bulk', fake_bulk)
+    @patch('elasticdata.reindex.helpers.scan', fake_scan)
+    def test_reindex(self):
+        client = Mock()
+        client.indices.get_alias.return_value = {}
+        path = os.path.join(self.tmp_dir, 'checkpoint.json')
+        count, errors = reindex(client, 'source', 'target', slices=[0, 1, 2], threads=2, checkpoint=path,
+                                alias='alias')
+        self.assertEqual(count, 9)
+        self.assertEqual(errors, [])
+        self.assertTrue(client.indices.update_aliases.called)
+        count, errors = reindex(client, 'source', 'target', slices=[0, 1, 2, 3], checkpoint=path)
+        self.assertEqual(count, 12)
+        self.assertEqual(Checkpoint(path).completed, {0, 1, 2, 3})
+
+    @patch('elasticdata.reindex.helpers.streaming_bulk', fake_bulk)
+    @patch('elasticdata.reindex.helpers.scan', fake_scan)
+    def test_reindex_errors(self):
+        def transform(action):
+            if action['_id'] == '0-1':
+                action['_id'] = 'bad'
+            return action
+        client = Mock()
+        self.assertRaises(RepositoryError, reindex, client, 'source', 'target', slices=[0, 1],
+                          transform=transform, alias='alias')
+        self.assertFalse(client.indices.update_aliases.called)
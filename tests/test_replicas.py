@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import socket
+import threading
+from unittest import TestCase
+from mock import Mock, patch
+from six.moves import BaseHTTPServer
+from elasticsearch import Elasticsearch, TransportError
+
+from elasticdata import Type, EntityManager
+from elasticdata.replicas import ReplicaSet, ReadPin
+
+
+class ReplicaTestType(Type):
+    pass
+
+
+class StandInServer(object):
+    """ Local http server answering every request with the same search response """
+    def __init__(self, name, status=200):
+        self.name = name
+        self.status = status
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                server.requests.append(self.path)
+                body = json.dumps({'took': 1, 'hits': {'total': 1, 'max_score': 1.0, 'hits': [{
+                    '_index': 'test', '_type': 'replica_test_type', '_id': '1', '_score': 1.0,
+                    '_source': {'server': server.name}
+                }]}}).encode('utf-8')
+                self.send_response(server.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.01, ))
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def client(self):
+        return Elasticsearch([{'host': '127.0.0.1', 'port': self.httpd.server_address[1]}], max_retries=0)
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def unused_client():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return Elasticsearch([{'host': '127.0.0.1', 'port': port}], max_retries=0, timeout=1)
+
+
+class ReplicaSetTestCase(TestCase):
+    def setUp(self):
+        self.primary = StandInServer('primary')
+        self.replicas = [StandInServer('replica1'), StandInServer('replica2')]
+
+    def tearDown(self):
+        for server in [self.primary] + self.replicas:
+            server.stop()
+
+    def query(self, em, **kwargs):
+        entities, meta = em.query({'query': {'match_all': {}}}, ReplicaTestType, **kwargs)
+        return entities[0]['server']
+
+    def test_read_write_splitting(self):
+        em = EntityManager(index='test', client=self.primary.client,
+                           read_client=ReplicaSet([server.client for server in self.replicas]))
+        self.assertEqual(set(self.query(em) for _ in range(4)), {'replica1', 'replica2'})
+        self.assertEqual(len(self.replicas[0].requests), 2)
+        self.assertEqual(self.query(em, primary=True), 'primary')
+        self.assertIs(em.get_read_client(primary=True), em.get_client())
+
+    def test_failover(self):
+        self.replicas[0].status = 503
+        replica_set = ReplicaSet([server.client for server in self.replicas] + [unused_client()])
+        em = EntityManager(index='test', client=self.primary.client, read_client=replica_set)
+        self.assertEqual([self.query(em) for _ in range(3)], ['replica2'] * 3)
+        self.assertEqual(len(self.replicas[0].requests), 1)
+        self.assertFalse(replica_set.is_healthy(replica_set.clients[0]))
+        self.assertFalse(replica_set.is_healthy(replica_set.clients[2]))
+        self.replicas[0].status = 200
+        replica_set.retry_after = 0
+        self.assertEqual(self.query(em), 'replica1')
+
+    def test_all_failing(self):
+        replica_set = ReplicaSet([unused_client()], retry_after=60)
+        self.assertRaises(TransportError, replica_set.search, index='test')
+        self.assertRaises(TransportError, replica_set.search, index='test')
+
+    def test_not_found_is_not_failover(self):
+        client = Mock()
+        client.get.side_effect = TransportError(404, 'not found')
+        replica_set = ReplicaSet([client, Mock()])
+        self.assertRaises(TransportError, replica_set.get, index='test', id='1')
+        self.assertTrue(replica_set.is_healthy(client))
+
+    def test_pin_reads(self):
+        em = EntityManager(index='test', client=self.primary.client, read_client=self.replicas[0].client,
+                           pin_reads=5)
+        self.assertEqual(self.query(em), 'replica1')
+        with patch('elasticdata.manager.helpers.streaming_bulk', return_value=iter([])):
+            em.persist(ReplicaTestType({'id': '2'}))
+            em.flush()
+        self.assertEqual(self.query(em), 'primary')
+        self.assertEqual(self.query(em, primary=False), 'replica1')
+        em._read_pin.duration = 0
+        with patch('elasticdata.manager.helpers.streaming_bulk', return_value=iter([])):
+            em.persist(ReplicaTestType({'id': '3'}))
+            em.flush()
+        self.assertEqual(self.query(em), 'replica1')
+
+    def test_shared_pin(self):
+        pin = ReadPin(5)
+        writer = EntityManager(index='test', client=self.primary.client, read_client=self.replicas[0].client,
+                               pin_reads=pin)
+        with patch('elasticdata.manager.helpers.streaming_bulk', return_value=iter([])):
+            writer.persist(ReplicaTestType({'id': '2'}))
+            writer.flush()
+        reader = EntityManager(index='test', client=self.primary.client, read_client=self.replicas[0].client,
+                               pin_reads=pin)
+        self.assertEqual(self.query(reader), 'primary')
+        self.assertTrue(pin.is_pinned(('test', 'replica_test_type')))
+        self.assertFalse(pin.is_pinned(('test', 'other_type')))
+        self.assertFalse(pin.is_pinned(('other', 'replica_test_type')))
+        self.assertTrue(pin.is_pinned())
+
+    def test_read_es_settings(self):
+        port = self.replicas[0].httpd.server_address[1]
+        em = EntityManager(index='test', client=self.primary.client,
+                           read_es_settings=[{'hosts': [{'host': '127.0.0.1', 'port': port}]}])
+        self.assertIsInstance(em.get_read_client(), ReplicaSet)
+        self.assertEqual(self.query(em), 'replica1')
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+from unittest import TestCase
+from mock import Mock
+from elasticsearch import TransportError
+from elasticsearch.serializer import JSONSerializer
+
+from elasticdata import Type, EntityManager, RepositoryError
+from elasticdata.metrics import MemoryMetrics
+from elasticdata.writebehind import WriteBehindQueue
+
+
+class WriteBehindTestType(Type):
+    pass
+
+
+class WriteBehindKeyedTestType(Type):
+    class Meta:
+        key_fields = ('number', )
+
+
+def fake_client(status=201):
+    client = Mock()
+    client.transport.serializer = JSONSerializer()
+    client.bodies = []
+
+    def bulk(body, **kwargs):
+        client.bodies.append(body)
+        actions = [JSONSerializer().loads(line) for line in body.strip().split('\n')[::2]]
+        return {'took': 1, 'items': [{list(a.keys())[0]: {'status': status}} for a in actions]}
+    client.bulk.side_effect = bulk
+    return client
+
+
+def stmt(i):
+    return {'_op_type': 'index', '_index': 'test', '_type': 't', '_id': str(i), '_source': {'i': i}}
+
+
+class WriteBehindQueueTestCase(TestCase):
+    def test_batching(self):
+        client = fake_client()
+        metrics = MemoryMetrics()
+        queue = WriteBehindQueue(client, batch_size=4, flush_interval=10, metrics=metrics)
+        source = {'i': [1]}
+        queue.put([dict(stmt(0), _source=source)])
+        source['i'].append(2)
+        queue.put([stmt(i) for i in range(1, 5)])
+        queue.stop()
+        self.assertEqual(len(client.bodies), 2)
+        self.assertEqual(client.bodies[0].count('\n'), 8)
+        self.assertIn('{"i": [1]}', client.bodies[0])
+        self.assertEqual(metrics.counters['elasticdata.write_behind.sent'], 5)
+
+    def test_backpressure(self):
+        client = fake_client()
+        release = threading.Event()
+        bulk = client.bulk.side_effect
+
+        def slow_bulk(body, **kwargs):
+            release.wait()
+            return bulk(body, **kwargs)
+        client.bulk.side_effect = slow_bulk
+        queue = WriteBehindQueue(client, max_size=2, batch_size=1, flush_interval=0)
+        queue.put([stmt(0)])
+        queue.put([stmt(1), stmt(2)], timeout=1)
+        self.assertRaises(RepositoryError, queue.put, [stmt(3)], timeout=0.05)
+        release.set()
+        queue.put([stmt(3)], timeout=1)
+        queue.stop()
+        self.assertEqual(len(client.bodies), 4)
+
+    def test_errors(self):
+        errors = []
+        queue = WriteBehindQueue(fake_client(status=400), flush_interval=0, on_error=errors.append)
+        queue.put([stmt(0)])
+        queue.stop()
+        self.assertEqual(len(errors[0]), 1)
+        client = fake_client()
+        client.bulk.side_effect = TransportError(500, 'error')
+        queue = WriteBehindQueue(client, flush_interval=0, on_error=errors.append)
+        queue.put([stmt(0)])
+        queue.put([stmt(1)])
+        queue.stop()
+        self.assertIsInstance(errors[1], TransportError)
+
+    def test_manager_flush(self):
+        client = fake_client()
+        queue = WriteBehindQueue(client, flush_interval=0)
+        em = EntityManager(index='test', client=client, write_behind=queue)
+        e = WriteBehindTestType({'foo': 'bar'})
+        em.persist(e)
+        em.flush()
+        self.assertIn('id', e)
+        e['foo'] = 'baz'
+        em.flush()
+        queue.stop()
+        body = ''.join(client.bodies)
+        self.assertLess(body.index('"create"'), body.index('"update"'))
+        self.assertRaises(RepositoryError, EntityManager(client=client).flush, background=True)
+
+    def test_derived_id_conflict(self):
+        errors = []
+        metrics = MemoryMetrics()
+        client = fake_client(status=409)
+        queue = WriteBehindQueue(client, flush_interval=0, on_error=errors.append, metrics=metrics)
+        em = EntityManager(index='test', client=client, write_behind=queue)
+        e = WriteBehindKeyedTestType({'number': 1})
+        em.persist(e)
+        em.flush()
+        self.assertEqual(e['id'], e.get_key_id())
+        em.persist(WriteBehindTestType({'foo': 'bar', 'id': '1'}))
+        em.flush()
+        queue.stop()
+        self.assertEqual(metrics.counters['elasticdata.write_behind.sent'], 1)
+        self.assertEqual(metrics.counters['elasticdata.write_behind.failed'], 1)
+        self.assertEqual(len(errors), 1)